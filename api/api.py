@@ -1,110 +1,330 @@
-from library.models import Book, BookLoan
+import codecs
+
+from django.http import Http404, StreamingHttpResponse
+from library import bulk, catalog_cache, services, versions
+from library.routers import read_from_replica
+from library.services import ConflictError, ServiceError
 from rest_framework import viewsets, permissions
-from .serializers import BookSerializer, BookLoanSerializer
+from .conditional import conditional
+from .pagination import BookCursorPagination
+from .permissions import IsLibraryAdmin, IsLibraryAdminOrReadOnly
+from .serializers import BookLoanReader, BookLoanSerializer, BookReader, BookSerializer, requested_fields
+from .streaming import NDJSONRenderer, is_streaming, stream_rows
+from .throttles import LoanBookThrottle, LoanUserThrottle
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db.models import OuterRef, Subquery
+from rest_framework.settings import api_settings
 from rest_framework import status
-from django.shortcuts import get_object_or_404
-from django.utils import timezone
+
+
+BULK_CONTENT_TYPES = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+# Largest batch accepted by the batch loan actions
+MAX_LOAN_BATCH = 500
+
+# Rate limits for the per-user loan write actions. Returns free copies and serve
+# the hold queue, so a borrowing crowd on one book must never block them
+LOAN_THROTTLES = [LoanUserThrottle, LoanBookThrottle]
+RETURN_THROTTLES = [LoanUserThrottle]
+
+
+def parse_loan_operations(data):
+    """
+    Turn {"operations": [{"user_id": 1, "book_id": 2}, ...]} into a list of
+    (user_id, book_id) tuples. Returns (operations, error message).
+    """
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list) or not operations:
+        return None, 'operations must be a non-empty list'
+    if len(operations) > MAX_LOAN_BATCH:
+        return None, f'At most {MAX_LOAN_BATCH} operations are allowed per request'
+
+    try:
+        return [(int(item['user_id']), int(item['book_id'])) for item in operations], None
+    except (KeyError, TypeError, ValueError):
+        return None, 'Every operation needs integer user_id and book_id'
+
+
+def parse_book_id(data):
+    """Read the integer book_id of a loan or hold request. Returns (book_id, error message)."""
+    book_id = data.get('book_id') if hasattr(data, 'get') else None
+    if book_id in (None, ''):
+        return None, 'book_id is required'
+    try:
+        return int(book_id), None
+    except (TypeError, ValueError):
+        return None, 'book_id must be an integer'
+
+
+def book_pk(kwargs):
+    """
+    The book id from the URL as an int, so /api/books/01/ shares the cache key
+    and version of /api/books/1/. Raises Http404 if it is not a number.
+    """
+    try:
+        return int(kwargs['pk'])
+    except (TypeError, ValueError):
+        raise Http404
 
 
 # ViewSet to manage CRUD operations for books
 class BookViewSet(viewsets.ModelViewSet):
-    queryset = Book.objects.all()                                # All books in the database
-    permission_classes = [permissions.IsAuthenticated]           # Requires user to be logged in
+    permission_classes = [permissions.IsAuthenticated, IsLibraryAdminOrReadOnly]  # Reads for users, writes for admins
     serializer_class = BookSerializer                            # Serializer to convert Book objects
+    pagination_class = BookCursorPagination                      # Keyset pagination ordered by id
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer]  # ?format=ndjson streams list
+
+    def get_queryset(self):
+        # All books, loading only the columns requested with ?fields= (e.g. skip abstract)
+        return services.list_books(requested_fields(self.request))
+
+    @conditional(lambda view, request, *args, **kwargs: versions.catalog())
+    def list(self, request, *args, **kwargs):
+        if is_streaming(request):
+            # The whole catalog, unpaginated and uncached, one book per line
+            fields = [name for name in BookSerializer.Meta.fields if name in (requested_fields(request) or [name])]
+            return stream_rows(self.get_queryset().order_by('id'), fields)
+
+        # Read-through cache keyed by the catalog version and the full URL (cursor, fields)
+        with read_from_replica(versions.catalog()):
+            data = catalog_cache.get_list(request.build_absolute_uri(), self.list_page)
+        return Response(data)
+
+    def list_page(self):
+        reader = BookReader(self.request)
+        page = self.paginate_queryset(reader.values(self.get_queryset()))
+        return self.get_paginated_response(reader.represent(page)).data
+
+    @conditional(lambda view, request, *args, **kwargs: versions.book(book_pk(kwargs)))
+    def retrieve(self, request, *args, **kwargs):
+        pk = book_pk(kwargs)
+        with read_from_replica(versions.book(pk)):
+            data = catalog_cache.get_book(
+                pk,
+                request.query_params.get('fields', ''),
+                lambda: BookReader(request).get(self.get_queryset(), pk),
+            )
+        return Response(data)
+
+    @action(detail=False, methods=['get', 'post'], url_path='bulk')
+    def bulk_books(self, request):
+        """
+        GET streams the whole catalog; POST imports a file upserting on ISBN.
+        Query parameters:
+        - file_format: csv (default) or jsonl
+        - batch_size: rows written per transaction on import (default 1000)
+        The request body is read line by line, never loaded whole.
+        """
+        file_format = request.query_params.get('file_format', 'csv')
+        if file_format not in bulk.FORMATS:
+            return Response({'error': f'file_format must be one of {", ".join(bulk.FORMATS)}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if request.method == 'GET':
+            response = StreamingHttpResponse(bulk.export_rows(file_format), content_type=BULK_CONTENT_TYPES[file_format])
+            response['Content-Disposition'] = f'attachment; filename="books.{file_format}"'
+            return response
+
+        if request.stream is None:
+            return Response({'error': 'Request body is empty'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            batch_size = max(1, int(request.query_params.get('batch_size', 1000)))
+        except ValueError:
+            return Response({'error': 'batch_size must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        lines = codecs.iterdecode(request.stream, 'utf-8-sig')
+        result = bulk.import_rows(bulk.read_rows(lines, file_format), batch_size=batch_size)
+        return Response(result.as_dict(), status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path='cache-stats', permission_classes=[IsLibraryAdmin])
+    def cache_stats(self, request):
+        """
+        Catalog cache hit/miss counters for this worker process.
+        """
+        return Response(catalog_cache.stats())
+
+    def update(self, request, *args, **kwargs):
+        try:
+            return super().update(request, *args, **kwargs)
+        except ConflictError as e:
+            return Response({'error': e.message}, status=status.HTTP_409_CONFLICT)
+
+    def perform_update(self, serializer):
+        """
+        Write only the fields that changed. If the client sends the `version` it
+        read, the update fails with 409 when the book has changed since.
+        """
+        try:
+            expected_version = int(self.request.data['version'])
+        except (KeyError, TypeError, ValueError):
+            expected_version = None
+
+        book = serializer.instance
+        changes = {name: value for name, value in serializer.validated_data.items() if getattr(book, name) != value}
+        services.update_book(book, changes, expected_version)
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Ranked full-text search over title, author and abstract.
+        Query parameters:
+        - q: search text (required)
+        - min_year / max_year: publication year range
+        - in_stock: only books with copies available
+        - limit: number of results (default 20, max 100)
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'q is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            min_year, max_year, limit = (
+                int(request.query_params[name]) if request.query_params.get(name) else default
+                for name, default in (('min_year', None), ('max_year', None), ('limit', services.SEARCH_LIMIT))
+            )
+        except ValueError:
+            return Response({'error': 'min_year, max_year and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+        books = services.search_books(
+            query,
+            min_year=min_year,
+            max_year=max_year,
+            in_stock=request.query_params.get('in_stock', '').lower() in ('1', 'true', 'yes'),
+            fields=requested_fields(request),
+            limit=max(1, min(limit, 100)),
+        )
+        serializer = self.get_serializer(books, many=True)
+        return Response(serializer.data)
 
 
 # ViewSet to manage book loans (borrowing and returning books)
 class LoansViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]           # Requires authentication
     serializer_class = BookLoanSerializer                        # Serializer to convert BookLoan objects
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer]  # ?format=ndjson streams list
 
     def get_queryset(self):
         """
         Return the most recent loan for each book the current user has interacted with.
         """
-        user = self.request.user
+        return services.current_loans(self.request.user)
 
-        # Subquery: Get latest loan per book for the user
-        latest_loan_subquery = BookLoan.objects.filter(
-            user=user,
-            book=OuterRef('book')
-        ).order_by('-id')
+    # Loans show book titles and authors, so catalog changes also change this list
+    @conditional(lambda view, request, *args, **kwargs: max(versions.loans(request.user.pk), versions.catalog()))
+    def list(self, request, *args, **kwargs):
+        if is_streaming(request):
+            return stream_rows(self.get_queryset(), BookLoanSerializer.Meta.fields)
 
-        # Final queryset using Subquery to fetch the latest loans
-        latest_loans = BookLoan.objects.filter(
-            id__in=Subquery(latest_loan_subquery.values('id')[:1])
-        ).select_related('book')
+        reader = BookLoanReader(request)
+        return Response(reader.represent(reader.values(self.get_queryset())))
 
-        return latest_loans
+    def retrieve(self, request, *args, **kwargs):
+        return Response(BookLoanReader(request).get(self.get_queryset(), kwargs['pk']))
 
-    @action(detail=False, methods=['post'], url_path='create-loan')
+    @action(detail=False, methods=['get'])
+    def history(self, request):
+        """
+        Every loan of the current user, newest first, including archived ones.
+        Paginated with ?before=<next>; each page also returns the next cursor.
+        """
+        try:
+            before = int(request.query_params['before']) if request.query_params.get('before') else None
+        except ValueError:
+            return Response({'error': 'before must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        loans, next_before = services.loan_history(request.user, before)
+        return Response({'results': loans, 'next': next_before})
+
+    @action(detail=False, methods=['post'], url_path='create-loan', throttle_classes=LOAN_THROTTLES)
     def create_new_loan(self, request):
         """
         Custom action to create a new loan for a book.
-        Ensures:
-        - Book ID is provided
-        - Book is in stock
-        - User doesn't already have an active loan for that book
-        """
-        user = request.user
-        book_id = request.data.get('book_id')
-
-        if not book_id:
-            return Response({'error': 'book_id is required'}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Find the book or return 404 if not found
-        book = get_object_or_404(Book, id=book_id)
-
-        # Check if book is available
-        if book.stock < 1:
-            return Response({'error': 'This book is currently not available.'}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Prevent borrowing the same book more than once without returning
-        existing_loan = BookLoan.objects.filter(user=user, book=book, return_date__isnull=True).first()
-        if existing_loan:
-            return Response({'error': "You already borrowed this book and haven't returned it."}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Create the loan
-        loan = BookLoan.objects.create(
-            user=user,
-            book=book,
-            loan_date=timezone.now().date()
-        )
+        Validation and stock handling live in library.services.borrow_book.
+        """
+        book_id, error = parse_book_id(request.data)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Decrease book stock
-        book.stock -= 1
-        book.save()
+        try:
+            loan = services.borrow_book(request.user, book_id)
+        except ServiceError as e:
+            return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
 
         serializer = self.get_serializer(loan)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-    @action(detail=False, methods=['post'], url_path='return-loan')
+    @action(detail=False, methods=['post'], url_path='return-loan', throttle_classes=RETURN_THROTTLES)
     def return_loan(self, request):
         """
         Custom action to return a borrowed book.
-        - Finds the current active loan for the user and book
-        - Marks it as returned
-        - Increments the book's stock
+        Delegates to library.services.return_book.
         """
-        user = request.user
-        book_id = request.data.get('book_id')
+        book_id, error = parse_book_id(request.data)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Look for an active loan (not yet returned)
-        loan = BookLoan.objects.filter(user=user, book_id=book_id, return_date__isnull=True).first()
-        
-        if not loan:
-            return Response({'error': 'You already returned this book or never borrowed it.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            services.return_book(request.user, book_id)
+        except ServiceError as e:
+            return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Mark loan as returned
-        loan.return_date = timezone.now().date()
-        loan.save()
+        return Response(status=status.HTTP_200_OK)
 
-        # Increase book stock
-        book = loan.book
-        book.stock += 1
-        book.save()
+    @action(detail=False, methods=['get', 'post'], throttle_classes=LOAN_THROTTLES)
+    def holds(self, request):
+        """
+        GET lists the books the current user is waiting for, with their place in each queue.
+        POST {"book_id": 1} joins the queue for an out-of-stock book; the next returned
+        copy is lent to the first user in the queue automatically.
+        """
+        if request.method == 'GET':
+            return Response(services.user_holds(request.user))
+
+        book_id, error = parse_book_id(request.data)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            hold, position = services.place_hold(request.user, book_id)
+        except ServiceError as e:
+            return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({'book_id': hold.book_id, 'position': position}, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'], url_path='cancel-hold')
+    def cancel_hold(self, request):
+        """Leave the queue for a book."""
+        book_id, error = parse_book_id(request.data)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            services.cancel_hold(request.user, book_id)
+        except ServiceError as e:
+            return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='bulk-create-loan', permission_classes=[IsLibraryAdmin])
+    def bulk_create_loans(self, request):
+        """
+        Batch variant of create-loan for the circulation desk (admins only).
+        Body: {"operations": [{"user_id": 1, "book_id": 2}, ...]}
+        Returns one result per operation, in order; a failed item doesn't stop the others.
+        """
+        operations, error = parse_loan_operations(request.data)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({'results': services.borrow_books(operations)}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='bulk-return-loan', permission_classes=[IsLibraryAdmin])
+    def bulk_return_loans(self, request):
+        """
+        Batch variant of return-loan for the circulation desk (admins only).
+        Body and response have the same shape as bulk-create-loan.
+        """
+        operations, error = parse_loan_operations(request.data)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response(status=status.HTTP_200_OK)
\ No newline at end of file
+        return Response({'results': services.return_books(operations)}, status=status.HTTP_200_OK)
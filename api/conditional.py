@@ -0,0 +1,35 @@
+import hashlib
+from functools import wraps
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def conditional(version_func):
+    """
+    Decorator for viewset actions that answers If-None-Match / If-Modified-Since.
+
+    `version_func(view, request, *args, **kwargs)` returns the nanosecond
+    timestamp of the last change to the resource (see library.versions). The
+    ETag is derived from it plus the URL and Accept header, so a 304 is
+    returned before any query or serialization happens.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            version = version_func(self, request, *args, **kwargs)
+            identity = f'{version}:{request.user.pk}:{request.get_full_path()}:{request.META.get("HTTP_ACCEPT", "")}'
+            etag = quote_etag(hashlib.md5(identity.encode(), usedforsecurity=False).hexdigest())
+            last_modified = version // 1_000_000_000
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is not None:
+                return response
+
+            response = method(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                response['ETag'] = etag
+                response['Last-Modified'] = http_date(last_modified)
+            return response
+        return wrapper
+    return decorator
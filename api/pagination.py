@@ -0,0 +1,10 @@
+from rest_framework.pagination import CursorPagination
+
+
+# Keyset pagination for the book catalog: each page is an indexed range scan on id,
+# so deep pages cost the same as the first one
+class BookCursorPagination(CursorPagination):
+    ordering = 'id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
@@ -0,0 +1,14 @@
+from rest_framework import permissions
+
+from library import roles
+
+
+# Role checks backed by library.roles; the role is loaded with the session user, so they cost no query
+class IsLibraryAdmin(permissions.BasePermission):
+    def has_permission(self, request, view):
+        return roles.is_admin(request.user)
+
+
+class IsLibraryAdminOrReadOnly(permissions.BasePermission):
+    def has_permission(self, request, view):
+        return request.method in permissions.SAFE_METHODS or roles.is_admin(request.user)
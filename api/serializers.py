@@ -1,18 +1,105 @@
+from django.core.exceptions import ValidationError
+from django.http import Http404
 from rest_framework import serializers
+from library import metrics
 from library.models import Book, BookLoan
 
 
-class BookSerializer(serializers.ModelSerializer):
+def requested_fields(request):
+    """
+    Return the field names from a ?fields=a,b,c query parameter, or None when
+    the client didn't ask for a sparse fieldset. Only applies to reads.
+    """
+    if request is None or request.method != 'GET' or not request.query_params.get('fields'):
+        return None
+    return [name.strip() for name in request.query_params['fields'].split(',') if name.strip()]
+
+
+class SparseFieldsMixin:
+    """Drop every field the client didn't list in ?fields=."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = requested_fields(self.context.get('request'))
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class TimedSerializerMixin:
+    """Report time spent turning objects into data to the per-request metrics."""
+
+    def to_representation(self, instance):
+        with metrics.track_serializer():
+            return super().to_representation(instance)
+
+
+class BookSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Book
-        fields = ('id', 'title', 'author', 'abstract','publication_year', 'stock') 
+        fields = ('id', 'isbn', 'title', 'author', 'abstract','publication_year', 'stock', 'loan_days', 'version')
+        read_only_fields = ('version',)
         
 
-class BookLoanSerializer(serializers.ModelSerializer):
+class BookLoanSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     book_title = serializers.CharField(source='book.title', read_only=True)
     book_id = serializers.IntegerField(source='book.id', read_only=True)
     book_author = serializers.CharField(source='book.author', read_only=True)
 
     class Meta:
         model = BookLoan
-        fields = ['id', 'book_id', 'book_title', 'book_author', 'loan_date', 'return_date']
\ No newline at end of file
+        fields = ['id', 'book_id', 'book_title', 'book_author', 'loan_date', 'due_date', 'return_date']
+
+
+def _iso_date(value):
+    return None if value is None else value.isoformat()
+
+
+class FastReader:
+    """
+    Read-only fast path for list/retrieve with the same output as the matching
+    serializer. Rows come from .values() and are reshaped by a plan of
+    (field, converter) pairs computed once per request, instead of DRF
+    running to_representation() field by field on model instances. Related
+    columns must already be annotated on the queryset. Writes and validation
+    still go through the DRF serializers.
+    """
+    fields = ()
+    converters = {}
+    sparse = False      # Honour ?fields= like SparseFieldsMixin
+
+    def __init__(self, request=None):
+        requested = requested_fields(request) if self.sparse else None
+        self.plan = [(name, self.converters.get(name)) for name in self.fields if not requested or name in requested]
+        # Always fetch the id: cursor pagination orders by it
+        self.columns = list(dict.fromkeys(['id', *(name for name, _ in self.plan)]))
+
+    def values(self, queryset):
+        return queryset.values(*self.columns)
+
+    def represent(self, rows):
+        with metrics.track_serializer():
+            return [
+                {name: convert(row[name]) if convert else row[name] for name, convert in self.plan}
+                for row in rows
+            ]
+
+    def get(self, queryset, pk):
+        # A malformed pk is a missing object, as in DRF's get_object_or_404
+        try:
+            rows = list(self.values(queryset.filter(pk=pk)))
+        except (TypeError, ValueError, ValidationError):
+            raise Http404
+        if not rows:
+            raise Http404
+        return self.represent(rows)[0]
+
+
+class BookReader(FastReader):
+    fields = BookSerializer.Meta.fields
+    sparse = True
+
+
+class BookLoanReader(FastReader):
+    fields = BookLoanSerializer.Meta.fields
+    converters = {'loan_date': _iso_date, 'due_date': _iso_date, 'return_date': _iso_date}
@@ -0,0 +1,52 @@
+"""
+Streaming NDJSON list responses (?format=ndjson).
+
+Rows are read with .values().iterator(), so no model instances or
+serializers are built. They are written one JSON object per line and sent
+in chunks of roughly STREAM_BUFFER_SIZE characters. Memory stays flat
+however many rows there are, and the first bytes go out after the first
+chunk.
+"""
+import io
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+
+NDJSON = 'application/x-ndjson'
+
+STREAM_BUFFER_SIZE = 64 * 1024
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Selects the streaming mode; also renders ordinary (e.g. error) responses as NDJSON."""
+    media_type = NDJSON
+    format = 'ndjson'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        rows = data if isinstance(data, list) else [data]
+        return ''.join(json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in rows).encode()
+
+
+def is_streaming(request):
+    return getattr(request, 'accepted_renderer', None) is not None and request.accepted_renderer.format == 'ndjson'
+
+
+def ndjson_chunks(rows):
+    encoder = DjangoJSONEncoder()
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(encoder.encode(row))
+        buffer.write('\n')
+        if buffer.tell() >= STREAM_BUFFER_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def stream_rows(queryset, fields, chunk_size=2000):
+    """Stream `queryset.values(*fields)` as an NDJSON response."""
+    rows = queryset.values(*fields).iterator(chunk_size=chunk_size)
+    return StreamingHttpResponse(ndjson_chunks(rows), content_type=NDJSON)
@@ -1,3 +1,135 @@
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from library import loan_state, services, versions
+from library.models import Book, BookLoan, Profile
+
+from .serializers import BookLoanReader, BookLoanSerializer, BookReader, BookSerializer
+
+
+class BatchLoanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('desk')
+        Profile.objects.create(user=cls.admin, role='admin')
+        cls.readers = User.objects.bulk_create([User(username=f'reader{n}') for n in range(50)])
+        cls.books = Book.objects.bulk_create(
+            [Book(title=f'Book {n}', author='Author', publication_year=2000, stock=2) for n in range(50)]
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def operations(self, size):
+        return {'operations': [{'user_id': user.id, 'book_id': book.id}
+                               for user, book in zip(self.readers[:size], self.books[:size])]}
+
+    def post(self, action, size):
+        response = self.client.post(f'/api/loans/{action}/', self.operations(size), format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_batch_borrow_query_count_does_not_grow_with_batch_size(self):
+        with CaptureQueriesContext(connection) as queries:
+            small = self.post('bulk-create-loan', 5)
+        with self.assertNumQueries(len(queries)):
+            large = self.post('bulk-create-loan', 50)
+
+        self.assertEqual([result['status'] for result in small], ['created'] * 5)
+        # The first five pairs already have open loans from the small batch
+        self.assertEqual([result['status'] for result in large], ['error'] * 5 + ['created'] * 45)
+        self.assertEqual(BookLoan.objects.filter(return_date__isnull=True).count(), 50)
+        self.assertEqual(Book.objects.get(id=self.books[0].id).stock, 1)
+
+    def test_batch_return_query_count_does_not_grow_with_batch_size(self):
+        self.post('bulk-create-loan', 50)
+
+        with CaptureQueriesContext(connection) as queries:
+            small = self.post('bulk-return-loan', 5)
+        with self.assertNumQueries(len(queries)):
+            large = self.post('bulk-return-loan', 50)
+
+        self.assertEqual([result['status'] for result in small], ['returned'] * 5)
+        self.assertEqual([result['status'] for result in large], ['error'] * 5 + ['returned'] * 45)
+        self.assertFalse(BookLoan.objects.filter(return_date__isnull=True).exists())
+        self.assertEqual(Book.objects.get(id=self.books[-1].id).stock, 2)
+
+    def test_batch_actions_are_admin_only(self):
+        reader = APIClient()
+        reader.force_authenticate(self.readers[0])
+        response = reader.post('/api/loans/bulk-create-loan/', self.operations(1), format='json')
+
+        self.assertEqual(response.status_code, 403)
+
+
+class FastReaderParityTests(TestCase):
+    """The values()-based readers must produce exactly what the serializers do."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader')
+        Profile.objects.create(user=cls.user)
+        cls.full = Book.objects.create(isbn='9780441013593', title='Dune', author='Frank Herbert',
+                                       abstract='Desert planet', publication_year=1965, stock=2, loan_days=7)
+        cls.sparse = Book.objects.create(title='Untitled', author='Anonymous', publication_year=1900, stock=0)
+        loans = [
+            BookLoan.objects.create(user=cls.user, book=cls.full, due_date=date(2030, 1, 8)),
+            BookLoan.objects.create(user=cls.user, book=cls.sparse),
+        ]
+        BookLoan.objects.filter(id=loans[1].id).update(return_date=date(2030, 1, 2))
+        loan_state.record(loans)
+
+    def setUp(self):
+        # Version bumps run on commit, which never happens inside a TestCase
+        cache.clear()
+
+    def request(self, **params):
+        return Request(APIRequestFactory().get('/api/books/', params))
+
+    def assertParity(self, reader, serializer_class, queryset, request):
+        self.assertEqual(
+            reader.represent(reader.values(queryset)),
+            serializer_class(queryset, many=True, context={'request': request}).data,
+        )
+
+    def test_book_reader_matches_serializer(self):
+        request = self.request()
+        self.assertParity(BookReader(request), BookSerializer, services.list_books().order_by('id'), request)
+
+    def test_book_reader_matches_serializer_with_sparse_fields(self):
+        request = self.request(fields='title,stock,loan_days')
+        books = services.list_books(['title', 'stock', 'loan_days']).order_by('id')
+        self.assertParity(BookReader(request), BookSerializer, books, request)
+
+    def test_loan_reader_matches_serializer(self):
+        request = self.request()
+        self.assertParity(BookLoanReader(request), BookLoanSerializer, services.current_loans(self.user), request)
+
+    def test_retrieve_matches_serializer(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        loan = services.current_loans(self.user).first()
+
+        self.assertEqual(client.get(f'/api/books/{self.full.id}/').json(), BookSerializer(self.full).data)
+        self.assertEqual(client.get(f'/api/loans/{loan.id}/').json(), BookLoanSerializer(loan).data)
+        self.assertEqual(client.get('/api/books/abc/').status_code, 404)
+
+    def test_retrieve_with_leading_zero_sees_updates(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get(f'/api/books/0{self.full.id}/').json()['stock'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.filter(id=self.full.id).update(stock=1)
+            versions.book_changed(self.full.id)
 
-# Create your tests here.
+        self.assertEqual(client.get(f'/api/books/0{self.full.id}/').json()['stock'], 1)
+        self.assertEqual(client.get(f'/api/books/{self.full.id}/').json()['stock'], 1)
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import SimpleRateThrottle
+
+# Rates are REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'][scope]. Over-limit requests
+# get 429 with Retry-After (DRF's Throttled). Counters live in the cache named by
+# THROTTLE_CACHE_ALIAS: locmem in development, a shared cache in production.
+
+
+class CacheAliasThrottle(SimpleRateThrottle):
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'THROTTLE_CACHE_ALIAS', 'default')]
+
+    def allow_request(self, request, view):
+        # Only writes are limited
+        if request.method in SAFE_METHODS:
+            return True
+        return super().allow_request(request, view)
+
+
+# Loan writes per user
+class LoanUserThrottle(CacheAliasThrottle):
+    scope = 'loan_user'
+
+    def get_cache_key(self, request, view):
+        if not request.user.is_authenticated:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': request.user.pk}
+
+
+# Borrows and holds per book, across all users, so a flash crowd can't pile up on one Book row
+class LoanBookThrottle(CacheAliasThrottle):
+    scope = 'loan_book'
+
+    def get_cache_key(self, request, view):
+        # Normalised, so ' 1' and '01' share book 1's bucket; the view rejects anything else
+        try:
+            book_id = int(request.data.get('book_id'))
+        except (AttributeError, TypeError, ValueError):
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': book_id}
@@ -1,9 +1,13 @@
+from django.urls import path
 from rest_framework import routers
 from .api import BookViewSet, LoansViewSet
+from .views import MetricsView
 
 router = routers.DefaultRouter()
 
 router.register('books', BookViewSet, 'books')
 router.register('loans', LoansViewSet, 'loans')
 
-urlpatterns = router.urls
\ No newline at end of file
+urlpatterns = [
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+] + router.urls
@@ -1,3 +1,14 @@
-from django.shortcuts import render
+from django.http import HttpResponse
+from rest_framework.views import APIView
 
-# Create your views here.
+from library import metrics
+
+from .permissions import IsLibraryAdmin
+
+
+# Per-route latency, query and render metrics in the Prometheus text format
+class MetricsView(APIView):
+    permission_classes = [IsLibraryAdmin]                        # Library admins only
+
+    def get(self, request):
+        return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,8 +44,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'library.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'library.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -57,14 +59,21 @@ ROOT_URLCONF = 'djangolibrary.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'library.metrics.InstrumentedTemplates',     # DjangoTemplates plus render timing
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Compile each template once per process; runserver's autoreloader still picks up edits
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'library.roles.context_processor',
             ],
         },
     },
@@ -76,17 +85,111 @@ WSGI_APPLICATION = 'djangolibrary.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Under ASGI (ASYNC_VIEWS, see library/config.py) Django should not keep
+# persistent connections, so the default there is to close them after each
+# request; use DB_POOL_MAX_SIZE to reuse connections instead
+_ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', '').lower() in ('1', 'true', 'yes')
+
+
+def _database(host):
+    engine = os.getenv('DB_ENGINE', 'django.db.backends.postgresql')
+    options = {}
+    if engine.endswith('postgresql') and os.getenv('DB_STATEMENT_TIMEOUT'):
+        # Milliseconds; PostgreSQL cancels any statement that runs longer
+        options['options'] = f"-c statement_timeout={os.getenv('DB_STATEMENT_TIMEOUT')}"
+    if engine.endswith('postgresql') and int(os.getenv('DB_POOL_MAX_SIZE', 0)):
+        # psycopg 3's connection pool (pip install "psycopg[binary,pool]"), one per worker process
+        options['pool'] = {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE')),
+            'timeout': int(os.getenv('DB_POOL_TIMEOUT', 10)),
+        }
+
+    return {
+        'ENGINE': engine,
+        'NAME': os.getenv('DB_NAME', 'dceo40ffubgauv'),
+        'USER': os.getenv('DB_USER', 'ube201nbbk46kn'),
+        'PASSWORD': os.getenv('DB_PASSWORD', 'pbe56b54239552fb4262886bb2297bac70f1489ec4dad61e1874d46dd9078b9a2'),
+        'HOST': host,
+        'PORT': os.getenv('DB_PORT', '5432'),
+        # Persistent connections can't be combined with the pool, which already reuses them
+        'CONN_MAX_AGE': 0 if 'pool' in options else int(os.getenv('DB_CONN_MAX_AGE', 0 if _ASYNC_VIEWS else 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': options,
+    }
+
+
 DATABASES = {
+    'default': _database(os.getenv('DB_HOST', 'c3v5n5ajfopshl.cluster-czrs8kj4isg7.us-east-1.rds.amazonaws.com')),
+}
+
+# Optional read replica for catalog reads (library/routers.py)
+if os.getenv('DB_REPLICA_HOST'):
+    DATABASES['replica'] = dict(_database(os.getenv('DB_REPLICA_HOST')), TEST={'MIRROR': 'default'})
+
+DATABASE_ROUTERS = ['library.routers.ReplicaRouter']
+REPLICA_MAX_LAG = float(os.getenv('DB_REPLICA_MAX_LAG', 2))     # Seconds after a change before reads go to the replica
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+# Shared by all workers when a Redis add-on provides REDIS_URL, otherwise per process
+if os.getenv('REDIS_URL'):
+    _CACHE_DEFAULTS = ('django.core.cache.backends.redis.RedisCache', os.getenv('REDIS_URL'))
+else:
+    _CACHE_DEFAULTS = ('django.core.cache.backends.locmem.LocMemCache', '')
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'dceo40ffubgauv',
-        'USER': 'ube201nbbk46kn',
-        'PASSWORD': 'pbe56b54239552fb4262886bb2297bac70f1489ec4dad61e1874d46dd9078b9a2',
-        'HOST': 'c3v5n5ajfopshl.cluster-czrs8kj4isg7.us-east-1.rds.amazonaws.com',
-        'PORT': '5432',
+        'BACKEND': os.getenv('CACHE_BACKEND', _CACHE_DEFAULTS[0]),
+        'LOCATION': os.getenv('CACHE_LOCATION', _CACHE_DEFAULTS[1]),
     }
 }
 
+# Book catalog read-through cache (library/catalog_cache.py)
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', 300))
+
+
+# Loan period in days by borrower role, unless the book sets its own loan_days
+LOAN_DAYS = {'regular': 14, 'admin': 28}
+
+
+# Sessions
+# https://docs.djangoproject.com/en/5.2/topics/http/sessions/
+# SESSION_MODE=db reads django_session on every request, cache serves reads from
+# the cache and falls back to the database, cookie keeps the (signed) session
+# in the cookie itself with no server-side reads at all.
+
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cache': 'django.contrib.sessions.backends.cached_db',
+    'cookie': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_ENGINE = SESSION_ENGINES[os.getenv('SESSION_MODE', 'db')]
+
+
+# REST API rate limits for loan writes (api/throttles.py); counters live in THROTTLE_CACHE_ALIAS
+REST_FRAMEWORK = {
+    'DEFAULT_THROTTLE_RATES': {
+        'loan_user': os.getenv('LOAN_USER_RATE', '30/min'),
+        'loan_book': os.getenv('LOAN_BOOK_RATE', '300/min'),
+    },
+}
+THROTTLE_CACHE_ALIAS = 'default'
+
+
+# Per-request metrics served at /api/metrics/ (library/metrics.py)
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+METRICS_BUFFER_SIZE = int(os.getenv('METRICS_BUFFER_SIZE', 1024))    # Samples kept per route
+
+
+# Authentication
+# ProfileBackend loads each request's user together with their Profile (library/roles.py)
+
+AUTHENTICATION_BACKENDS = ['library.roles.ProfileBackend']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -121,8 +224,6 @@ USE_TZ = True
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
-import os
-
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles') 
 
@@ -17,20 +17,24 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from django.conf.urls import handler404
-from library import views
+from library import async_views, views
+from library.config import API_MODE, ASYNC_VIEWS
+
+# Pages that only wait on the REST API in remote mode can be served by async views
+api_views = async_views if API_MODE == 'remote' and ASYNC_VIEWS else views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
-    path('', views.home, name='home'),
+    path('', api_views.home, name='home'),
     path('signup/', views.signup, name='signup'),
     path('logout/', views.signout, name='logout'),
     path('signin/', views.signin, name='signin'),
-    path('books/', views.books, name='books'),
+    path('books/', api_views.books, name='books'),
     path('books/create/', views.create_book, name='create_book'),
     path('books/<int:book_id>/', views.detail_book, name='detail_book'),
-    path('books/<int:book_id>/borrow', views.borrow_book, name='borrow_book'),
-    path('books/<int:book_id>/return', views.return_book, name='return_book'),
+    path('books/<int:book_id>/borrow', api_views.borrow_book, name='borrow_book'),
+    path('books/<int:book_id>/return', api_views.return_book, name='return_book'),
     path('books/<int:book_id>/delete', views.delete_book, name='delete_book'),
 ]
 
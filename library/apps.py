@@ -1,6 +1,31 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_migrate, post_save
+
+
+def reinstall_search(sender, using, **kwargs):
+    # Table rebuilds in later migrations drop SQLite triggers; put them back
+    from django.db import connections
+    from . import search
+    if connections[using].vendor == 'sqlite':
+        search.install(connections[using])
 
 
 class LibraryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'library'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from . import checks, metrics, versions  # noqa: F401 (checks registers system checks)
+        from .models import Book, BookLoan
+
+        post_migrate.connect(reinstall_search, sender=self)
+
+        # Count and time SQL queries for the per-request metrics
+        connection_created.connect(metrics.install_db_wrapper)
+
+        # Bump cache/ETag versions on every Book and BookLoan write (API, forms, admin)
+        post_save.connect(versions.book_saved, sender=Book)
+        post_delete.connect(versions.book_deleted, sender=Book)
+        post_save.connect(versions.loan_saved, sender=BookLoan)
+        post_delete.connect(versions.loan_deleted, sender=BookLoan)
@@ -0,0 +1,50 @@
+"""
+Archival of old returned loans from BookLoan into ArchivedLoan.
+
+Loans move in batches, and each batch copies and deletes in one transaction.
+An interrupted run therefore leaves every loan in exactly one table, and
+running it again continues where it stopped. The latest loan of each
+(user, book) stays in BookLoan because CurrentLoan points at it, so hot
+queries (open loans, current loans) never need the archive, and moving a
+loan changes nothing the loan ETags cover.
+"""
+import calendar
+
+from django.db import connection, transaction
+
+from .models import ArchivedLoan, BookLoan
+
+
+def months_before(day, months):
+    """The same day `months` calendar months earlier (clamped to the month's length)."""
+    year, month = divmod(day.year * 12 + day.month - 1 - months, 12)
+    return day.replace(year=year, month=month + 1, day=min(day.day, calendar.monthrange(year, month + 1)[1]))
+
+
+def archive_loans(returned_before, batch_size=5000, progress=None):
+    """
+    Move loans returned before `returned_before` that are no longer anyone's
+    current loan into ArchivedLoan. Returns the number moved; `progress(moved)`
+    is called after every batch.
+    """
+    candidates = BookLoan.objects.filter(return_date__lt=returned_before, current__isnull=True).order_by('id')
+    moved = 0
+    while True:
+        with transaction.atomic():
+            loans = list(candidates.values('id', 'user_id', 'book_id', 'loan_date', 'due_date', 'return_date')[:batch_size])
+            if not loans:
+                return moved
+            ArchivedLoan.objects.bulk_create([ArchivedLoan(**loan) for loan in loans])
+            # Plain SQL, so no post_delete signal bumps each user's loan version
+            # although no current loan changed; nothing references these rows
+            ids = [loan['id'] for loan in loans]
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM {connection.ops.quote_name(BookLoan._meta.db_table)} '
+                    f'WHERE id IN ({", ".join(["%s"] * len(ids))})',
+                    ids,
+                )
+
+        moved += len(loans)
+        if progress:
+            progress(moved)
@@ -0,0 +1,68 @@
+"""
+Async versions of the pages that only wait on the REST API in remote mode.
+
+Under ASGI (e.g. gunicorn with uvicorn workers) a worker keeps serving other
+requests while these wait on the API, instead of blocking a sync worker per
+call. Enabled with API_MODE=remote and ASYNC_VIEWS=1; see djangolibrary/urls.py.
+Rendering and messages touch the session and user profile through the ORM, so
+they run in a thread via sync_to_async.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.http import Http404
+from django.shortcuts import redirect, render
+
+from .backends import AsyncRemoteBackend
+from .services import ServiceError
+
+render_async = sync_to_async(render)
+add_message = sync_to_async(messages.add_message)
+
+
+# View for displaying the homepage with one page of the book catalog
+@login_required
+async def home(request):
+    cursor = request.GET.get('cursor')
+    books, next_cursor = await AsyncRemoteBackend(request).list_books(cursor)
+    return await render_async(request, 'home.html', {
+        'books': books,
+        'next_cursor': next_cursor,
+        'is_first_page': not cursor,
+    })
+
+
+# View to list current book loans
+@login_required
+async def books(request):
+    return await render_async(request, 'books.html', {
+        'loans': await AsyncRemoteBackend(request).list_loans()
+    })
+
+
+# View to borrow a book
+@login_required
+async def borrow_book(request, book_id):
+    try:
+        await AsyncRemoteBackend(request).borrow_book(book_id)
+    except Http404:
+        await add_message(request, messages.WARNING, "Book not found.")
+    except ServiceError as e:
+        await add_message(request, messages.WARNING, e.message)
+    else:
+        await add_message(request, messages.SUCCESS, "Loan created successfully.")
+
+    return redirect('books')
+
+
+# View to return a borrowed book
+@login_required
+async def return_book(request, book_id):
+    try:
+        await AsyncRemoteBackend(request).return_book(book_id)
+    except ServiceError as e:
+        await add_message(request, messages.WARNING, e.message)
+    else:
+        await add_message(request, messages.SUCCESS, "Book returned successfully.")
+
+    return redirect('books')
@@ -0,0 +1,263 @@
+"""
+Data backends used by the HTML views.
+
+LocalBackend calls library.services in-process (the default). RemoteBackend keeps
+the old behaviour of talking to a separate deployment of the REST API over HTTP;
+enable it with API_MODE=remote. AsyncRemoteBackend is its asyncio counterpart
+for the async views.
+"""
+import asyncio
+import hashlib
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import httpx  # Async HTTP client for the async views
+import requests  # Used to make HTTP requests to external/internal APIs
+from requests.adapters import HTTPAdapter
+from django.core.cache import cache
+from django.http import Http404
+
+from . import metrics, services
+from .config import (
+    API_BASE_URL, API_MODE, REMOTE_API_MAX_CONCURRENCY, REMOTE_API_POOL_SIZE, REMOTE_API_TIMEOUT,
+)
+from .models import Book
+from .services import ConflictError, ServiceError
+
+# How long RemoteBackend keeps response bodies around for revalidation
+REMOTE_CACHE_TIMEOUT = 60 * 60
+
+
+class LocalBackend:
+    def __init__(self, request):
+        self.request = request
+
+    def list_books(self, cursor=None):
+        try:
+            after = int(cursor) if cursor else None
+        except ValueError:
+            after = None
+        return services.book_page(after)
+
+    def list_loans(self):
+        return services.current_loans(self.request.user)
+
+    def get_book(self, book_id):
+        return services.get_book(book_id)
+
+    def create_book(self, data):
+        return services.create_book(**data)
+
+    def update_book(self, book, changes, expected_version=None):
+        return services.update_book(book, changes, expected_version)
+
+    def delete_book(self, book_id):
+        services.delete_book(book_id)
+
+    def borrow_book(self, book_id):
+        return services.borrow_book(self.request.user, book_id)
+
+    def return_book(self, book_id):
+        return services.return_book(self.request.user, book_id)
+
+
+class _RejectCookies(DefaultCookiePolicy):
+    """Never store cookies from API responses in a client shared by all users."""
+
+    def set_ok(self, cookie, request):
+        return False
+
+
+def _session():
+    """
+    Process-wide requests.Session, so calls reuse pooled keep-alive connections
+    instead of doing a new TCP/TLS handshake every time.
+    """
+    global _http_session
+    if _http_session is None:
+        session = requests.Session()
+        session.cookies.set_policy(_RejectCookies())
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=REMOTE_API_POOL_SIZE)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _http_session = session
+    return _http_session
+
+
+_http_session = None
+
+
+class RemoteBackend:
+    """Talks to the REST API at API_BASE_URL, forwarding the user's session."""
+
+    base_url = API_BASE_URL
+
+    def __init__(self, request):
+        self.request = request
+
+    def _prepare(self, method, path):
+        csrf_token = self.request.COOKIES.get('csrftoken', '')
+        session_id = self.request.COOKIES.get('sessionid', '')
+        headers = {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': csrf_token,
+            'Referer': self.base_url,
+            # Pass session cookie for authentication; sent as a header because
+            # the shared clients don't keep a cookie jar
+            'Cookie': f'sessionid={session_id}; csrftoken={csrf_token}',
+        }
+
+        # Revalidate GETs against the copy we already have instead of downloading it again
+        identity = f'{session_id}:{path}'.encode()
+        cache_key = f'remote-api:{hashlib.md5(identity, usedforsecurity=False).hexdigest()}'
+        return headers, cache_key
+
+    def _result(self, method, response, expected, cached):
+        """Turn an API response into data, or raise Http404/ServiceError."""
+        if response.status_code == 304 and cached:
+            return cached['data']
+        if response.status_code == 404:
+            raise Http404("Book not found.")
+        if response.status_code != expected:
+            try:
+                data = response.json()
+            except ValueError:
+                raise ServiceError()
+            if isinstance(data, dict) and 'error' in data:
+                raise (ConflictError if response.status_code == 409 else ServiceError)(data['error'])
+            raise ServiceError(f"Unexpected response: {response.status_code} - {response.text}")
+
+        return response.json() if response.content else None
+
+    def _send(self, method, path, expected, payload=None):
+        headers, cache_key = self._prepare(method, path)
+        cached = cache.get(cache_key) if method == 'GET' else None
+        if cached:
+            headers['If-None-Match'] = cached['etag']
+
+        try:
+            with metrics.track_http():
+                response = _session().request(method, f'{self.base_url}{path}', json=payload, headers=headers,
+                                              timeout=REMOTE_API_TIMEOUT)
+        except requests.RequestException as e:
+            raise ServiceError(f"Request failed: {str(e)}")
+
+        data = self._result(method, response, expected, cached)
+        if method == 'GET' and response.status_code != 304 and 'ETag' in response.headers:
+            cache.set(cache_key, {'etag': response.headers['ETag'], 'data': data}, REMOTE_CACHE_TIMEOUT)
+        return data
+
+    def _books_path(self, cursor):
+        query = {'fields': ','.join(services.CARD_FIELDS), 'page_size': services.BOOK_PAGE_SIZE}
+        if cursor:
+            query['cursor'] = cursor
+        return f'/api/books/?{urlencode(query)}'
+
+    def _books_page(self, page):
+        # Forward the API's opaque cursor so the next page continues where this one stopped
+        next_cursor = parse_qs(urlparse(page['next']).query).get('cursor', [None])[0] if page['next'] else None
+        return page['results'], next_cursor
+
+    def list_books(self, cursor=None):
+        try:
+            return self._books_page(self._send('GET', self._books_path(cursor), 200))
+        except ServiceError:
+            return [], None
+
+    def list_loans(self):
+        try:
+            return self._send('GET', '/api/loans/', 200)
+        except ServiceError:
+            return []
+
+    def get_book(self, book_id):
+        return Book(**self._send('GET', f'/api/books/{book_id}/', 200))
+
+    def create_book(self, data):
+        return self._send('POST', '/api/books/', 201, data)
+
+    def update_book(self, book, changes, expected_version=None):
+        payload = dict(changes, version=book.version if expected_version is None else expected_version)
+        return Book(**self._send('PATCH', f'/api/books/{book.id}/', 200, payload))
+
+    def delete_book(self, book_id):
+        self._send('DELETE', f'/api/books/{book_id}/', 204)
+
+    def borrow_book(self, book_id):
+        return self._send('POST', '/api/loans/create-loan/', 201, {'book_id': book_id})
+
+    def return_book(self, book_id):
+        return self._send('POST', '/api/loans/return-loan/', 200, {'book_id': book_id})
+
+
+class AsyncRemoteBackend(RemoteBackend):
+    """
+    RemoteBackend for the async views in library/async_views.py.
+
+    All requests in a worker share one httpx.AsyncClient (keep-alive connection
+    pool, timeouts) and a semaphore that bounds how many API calls are in
+    flight at once.
+    """
+
+    _clients = {}
+
+    @classmethod
+    def _client(cls):
+        # httpx clients are tied to the event loop that created them
+        loop = asyncio.get_running_loop()
+        if loop not in cls._clients:
+            cls._clients.clear()
+            cls._clients[loop] = (
+                httpx.AsyncClient(
+                    timeout=REMOTE_API_TIMEOUT,
+                    limits=httpx.Limits(max_connections=REMOTE_API_POOL_SIZE,
+                                        max_keepalive_connections=REMOTE_API_POOL_SIZE),
+                    cookies=CookieJar(policy=_RejectCookies()),
+                ),
+                asyncio.Semaphore(REMOTE_API_MAX_CONCURRENCY),
+            )
+        return cls._clients[loop]
+
+    async def _send(self, method, path, expected, payload=None):
+        headers, cache_key = self._prepare(method, path)
+        cached = await cache.aget(cache_key) if method == 'GET' else None
+        if cached:
+            headers['If-None-Match'] = cached['etag']
+
+        client, semaphore = self._client()
+        try:
+            async with semaphore:
+                with metrics.track_http():
+                    response = await client.request(method, f'{self.base_url}{path}', json=payload, headers=headers)
+        except httpx.HTTPError as e:
+            raise ServiceError(f"Request failed: {str(e)}")
+
+        data = self._result(method, response, expected, cached)
+        if method == 'GET' and response.status_code != 304 and 'ETag' in response.headers:
+            await cache.aset(cache_key, {'etag': response.headers['ETag'], 'data': data}, REMOTE_CACHE_TIMEOUT)
+        return data
+
+    async def list_books(self, cursor=None):
+        try:
+            return self._books_page(await self._send('GET', self._books_path(cursor), 200))
+        except ServiceError:
+            return [], None
+
+    async def list_loans(self):
+        try:
+            return await self._send('GET', '/api/loans/', 200)
+        except ServiceError:
+            return []
+
+    async def borrow_book(self, book_id):
+        return await self._send('POST', '/api/loans/create-loan/', 201, {'book_id': book_id})
+
+    async def return_book(self, book_id):
+        return await self._send('POST', '/api/loans/return-loan/', 200, {'book_id': book_id})
+
+
+def get_backend(request):
+    """Return the backend selected by API_MODE for this request."""
+    if API_MODE == 'remote':
+        return RemoteBackend(request)
+    return LocalBackend(request)
@@ -0,0 +1,173 @@
+"""
+Streaming bulk import/export of the book catalog (CSV or JSON Lines).
+
+Rows are read and written one at a time, validated with the same rules as
+BookForm, and upserted in fixed-size batches keyed on ISBN, so memory use does
+not grow with the size of the file. Used by the import_books/export_books
+management commands and by /api/books/bulk/.
+"""
+import csv
+import io
+import json
+import time
+
+from django.db import transaction
+from django.db.models import F
+
+from . import versions
+from .forms import BookForm
+from .models import Book
+
+FIELDS = ('isbn', 'title', 'author', 'abstract', 'publication_year', 'stock')
+FORMATS = ('csv', 'jsonl')
+
+# Stop collecting error details after this many invalid rows
+MAX_REPORTED_ERRORS = 100
+
+EXPORT_BUFFER_SIZE = 64 * 1024
+
+
+class BulkBookForm(BookForm):
+    """BookForm without the per-row uniqueness query: an existing ISBN means update."""
+
+    class Meta(BookForm.Meta):
+        fields = list(FIELDS)
+
+    def validate_unique(self):
+        pass
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.invalid = 0
+        self.errors = []
+        self.started = time.monotonic()
+
+    @property
+    def rows(self):
+        return self.created + self.updated + self.invalid
+
+    @property
+    def rows_per_second(self):
+        elapsed = time.monotonic() - self.started
+        return round(self.rows / elapsed) if elapsed else self.rows
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'invalid': self.invalid,
+            'errors': self.errors,
+            'rows_per_second': self.rows_per_second,
+        }
+
+
+def read_rows(lines, file_format):
+    """Yield one dict per record from an iterable of text lines (None for unparseable JSON lines)."""
+    if file_format == 'csv':
+        yield from csv.DictReader(lines)
+    else:
+        for line in lines:
+            if line.strip():
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield row if isinstance(row, dict) else None
+
+
+def import_rows(rows, batch_size=1000, progress=None):
+    """
+    Validate and upsert rows in batches of `batch_size`; each batch is its own
+    transaction. `progress(result)` is called after every batch.
+    """
+    result = ImportResult()
+    batch = []
+
+    for line_number, row in enumerate(rows, start=1):
+        if row is None:
+            errors = {'__all__': ['Row is not a valid JSON object.']}
+        else:
+            form = BulkBookForm({name: row.get(name) for name in FIELDS})
+            if form.is_valid():
+                batch.append(form.instance)
+                errors = None
+            else:
+                errors = {field: list(messages) for field, messages in form.errors.items()}
+
+        if errors:
+            result.invalid += 1
+            if len(result.errors) < MAX_REPORTED_ERRORS:
+                result.errors.append({'row': line_number, 'errors': errors})
+
+        if len(batch) >= batch_size:
+            _write_batch(batch, result)
+            batch = []
+            if progress:
+                progress(result)
+
+    if batch:
+        _write_batch(batch, result)
+        if progress:
+            progress(result)
+    return result
+
+
+def _write_batch(books, result):
+    # Later rows win when a batch repeats an ISBN; each repeat counts as an
+    # update of the row it replaces, so every input row is reported once
+    with_isbn = {}
+    without_isbn = []
+    repeated = 0
+    for book in books:
+        if book.isbn:
+            repeated += book.isbn in with_isbn
+            with_isbn[book.isbn] = book
+        else:
+            without_isbn.append(book)
+
+    with transaction.atomic():
+        existing = Book.objects.only('id', 'isbn').in_bulk(list(with_isbn), field_name='isbn')
+
+        to_update = []
+        for isbn, book in with_isbn.items():
+            if isbn in existing:
+                book.pk = existing[isbn].pk
+                # Incremented by the UPDATE itself, so a concurrent bump isn't lost
+                book.version = F('version') + 1
+                to_update.append(book)
+            else:
+                without_isbn.append(book)
+
+        Book.objects.bulk_create(without_isbn)
+        Book.objects.bulk_update(to_update, [name for name in FIELDS if name != 'isbn'] + ['version'])
+
+        # bulk_create/bulk_update don't send signals
+        versions.books_changed([book.pk for book in to_update])
+
+    result.created += len(without_isbn)
+    result.updated += len(to_update) + repeated
+
+
+def export_rows(file_format, chunk_size=2000):
+    """Yield the whole catalog as encoded text in chunks of roughly EXPORT_BUFFER_SIZE characters."""
+    books = Book.objects.order_by('id').values_list(*FIELDS).iterator(chunk_size=chunk_size)
+
+    buffer = io.StringIO()
+    if file_format == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(FIELDS)
+        write = writer.writerow
+    else:
+        def write(values):
+            buffer.write(json.dumps(dict(zip(FIELDS, values))) + '\n')
+
+    for values in books:
+        write(values)
+        if buffer.tell() >= EXPORT_BUFFER_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
@@ -0,0 +1,117 @@
+"""
+Versioned read-through cache for the book catalog.
+
+List pages are keyed by the catalog-wide version counter, so any change to any
+book (including stock changes from loans) retires every cached page at once.
+Single books are keyed by their own version counter, so a change to one book
+only invalidates that book's entries. Nothing is ever deleted or flushed: bumping
+a version (see library/versions.py) makes the old keys unreachable and they
+expire on their own.
+
+Concurrent misses for the same key are coalesced: one request computes the
+value while the others wait for it, within a process and (through a lock key
+in the cache) across processes.
+
+Works with any Django cache backend (locmem, file, Redis, memcached).
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import versions
+
+# Followers wait at most this many seconds for the request computing a value
+COALESCE_TIMEOUT = 5
+
+_stats = {'hits': 0, 'misses': 0, 'coalesced': 0}
+_stats_lock = threading.Lock()
+
+# Values being computed in this process, by cache key
+_flights = {}
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+
+
+def _cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def _digest(identity):
+    return hashlib.md5(identity.encode(), usedforsecurity=False).hexdigest()
+
+
+def _read_through(key, compute):
+    value = _cache().get(key)
+    if value is not None:
+        with _stats_lock:
+            _stats['hits'] += 1
+        return value
+
+    # Single flight: the first miss computes, identical concurrent misses wait for it
+    with _stats_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+        _stats['misses' if leader else 'coalesced'] += 1
+
+    if not leader:
+        if flight.done.wait(COALESCE_TIMEOUT) and flight.value is not None:
+            return flight.value
+        # The leader failed or is too slow; the cache lock still lets only one retry
+        return _compute_once(key, compute)
+
+    try:
+        flight.value = _compute_once(key, compute)
+        return flight.value
+    finally:
+        with _stats_lock:
+            del _flights[key]
+        flight.done.set()
+
+
+def _compute_once(key, compute):
+    # Across processes the lock is a cache key: whoever adds it computes, the
+    # others poll the cache for the result until COALESCE_TIMEOUT
+    lock = f'{key}:lock'
+    locked = _cache().add(lock, 1, COALESCE_TIMEOUT)
+    if not locked:
+        deadline = time.monotonic() + COALESCE_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            value = _cache().get(key)
+            if value is not None:
+                return value
+
+    try:
+        value = compute()
+        _cache().set(key, value, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300))
+        return value
+    finally:
+        if locked:
+            _cache().delete(lock)
+
+
+def get_list(identity, compute):
+    """Return the cached catalog listing identified by `identity` (e.g. the full URL)."""
+    key = f'catalog:list:{versions.catalog()}:{_digest(identity)}'
+    return _read_through(key, compute)
+
+
+def get_book(book_id, identity, compute):
+    """Return the cached representation of one book; `identity` separates variants such as ?fields=."""
+    key = f'catalog:book:{book_id}:{versions.book(book_id)}:{_digest(identity)}'
+    return _read_through(key, compute)
+
+
+def stats():
+    """Hit/miss/coalesced counters for this process."""
+    with _stats_lock:
+        return dict(_stats)
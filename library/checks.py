@@ -0,0 +1,55 @@
+"""
+System checks for settings that only work when every worker shares them.
+
+The catalog cache and the ETag/Last-Modified counters (library/versions.py)
+live in CATALOG_CACHE_ALIAS. A per-process cache gives every worker its own
+counters, so a write bumps them in one worker only and the others keep
+answering 304 and serving cached catalog pages for data that has changed.
+"""
+import os
+
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# Backends whose entries are only visible to the process that wrote them
+PROCESS_LOCAL_CACHES = {'django.core.cache.backends.locmem.LocMemCache'}
+
+HINT = ('Attach a Redis add-on (REDIS_URL), or set CACHE_BACKEND and CACHE_LOCATION '
+        'to a cache shared by all workers, or run a single worker.')
+
+
+def _workers():
+    # Gunicorn and uvicorn read WEB_CONCURRENCY, which Heroku sets per dyno size
+    try:
+        return int(os.getenv('WEB_CONCURRENCY', 1))
+    except ValueError:
+        return 1
+
+
+def _process_local_cache():
+    """The (alias, backend) of CATALOG_CACHE_ALIAS if it is private to each process, else None."""
+    alias = getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    return (alias, backend) if backend in PROCESS_LOCAL_CACHES else None
+
+
+def _message(alias, backend):
+    return f'CATALOG_CACHE_ALIAS ({alias!r}) uses {backend}, which is private to each worker process.'
+
+
+@register(Tags.caches)
+def check_version_cache(app_configs, **kwargs):
+    # A warning, not an error: errors would fail the release phase's migrate
+    local = _process_local_cache()
+    if local and _workers() > 1:
+        return [Warning(_message(*local), hint=HINT, id='library.W002')]
+    return []
+
+
+@register(Tags.caches, deploy=True)
+def check_version_cache_deploy(app_configs, **kwargs):
+    # manage.py check --deploy: a single worker works, but won't scale out
+    local = _process_local_cache()
+    if local and _workers() <= 1:
+        return [Warning(_message(*local), hint=HINT, id='library.W001')]
+    return []
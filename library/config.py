@@ -1,3 +1,15 @@
 import os
 
 API_BASE_URL = os.getenv('API_BASE_URL', 'https://django-library-328bec4effe8.herokuapp.com')
+
+# 'local' serves pages from library.services in-process; 'remote' calls the REST API at API_BASE_URL
+API_MODE = os.getenv('API_MODE', 'local')
+
+# Remote mode HTTP client: seconds before a call to the API times out, keep-alive
+# connections per worker, and API calls in flight at once per async worker
+REMOTE_API_TIMEOUT = float(os.getenv('REMOTE_API_TIMEOUT', 10))
+REMOTE_API_POOL_SIZE = int(os.getenv('REMOTE_API_POOL_SIZE', 20))
+REMOTE_API_MAX_CONCURRENCY = int(os.getenv('REMOTE_API_MAX_CONCURRENCY', 50))
+
+# Serve the remote-mode pages from the async views (run under ASGI, e.g. uvicorn workers)
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', '').lower() in ('1', 'true', 'yes')
@@ -5,8 +5,9 @@ from .models import Book
 class BookForm(forms.ModelForm):
     class Meta:
         model = Book
-        fields = ['title', 'author', 'abstract', 'publication_year', 'stock']
+        fields = ['isbn', 'title', 'author', 'abstract', 'publication_year', 'stock']
         widgets = {
+            'isbn': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'ISBN (optional)'}),
             'title': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Enter title'}),
             'author': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Enter author'}),
             'abstract': forms.Textarea(attrs={'class': 'form-control', 'rows': 3, 'placeholder': 'Enter abstract'}),
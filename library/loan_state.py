@@ -0,0 +1,94 @@
+"""
+Maintenance of the CurrentLoan table: one row per (user, book) pointing at the
+user's latest BookLoan for that book.
+
+library.services calls record() in the same transaction that creates loans.
+Returns need no write: the open loan is always the latest one, so the row
+already points at it. rebuild() and check() recompute the table from the loan
+history in batches of users (rebuild_current_loans / check_current_loans).
+"""
+from django.contrib.auth.models import User
+from django.db.models import Max
+
+from .models import BookLoan, CurrentLoan
+
+
+def record(loans):
+    """Make each of the given (saved) loans the current one for its user and book, in one upsert."""
+    CurrentLoan.objects.bulk_create(
+        [CurrentLoan(user_id=loan.user_id, book_id=loan.book_id, loan_id=loan.id) for loan in loans],
+        update_conflicts=True,
+        unique_fields=['user', 'book'],
+        update_fields=['loan'],
+    )
+
+
+def _user_batches(batch_size, users=None):
+    if users is not None:
+        users = sorted(users)
+        for start in range(0, len(users), batch_size):
+            yield users[start:start + batch_size]
+        return
+
+    last_id = 0
+    while True:
+        user_ids = list(User.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not user_ids:
+            return
+        yield user_ids
+        last_id = user_ids[-1]
+
+
+def _latest(user_ids):
+    # One pass over the (user, book, -id) index for the whole batch
+    rows = (
+        BookLoan.objects.filter(user_id__in=user_ids)
+        .values('user_id', 'book_id')
+        .annotate(loan_id=Max('id'))
+        .order_by()
+    )
+    return {(row['user_id'], row['book_id']): row['loan_id'] for row in rows}
+
+
+def rebuild(batch_size=1000, progress=None, users=None):
+    """
+    Recompute CurrentLoan from BookLoan for every user (or only the given user
+    ids), `batch_size` users per upsert. Returns the number of rows written;
+    `progress(users, rows)` is called after every batch. A loan created while
+    a batch is being computed can be overwritten by the older one, so run
+    check() afterwards if loans were being made at the same time.
+    """
+    done = rows = 0
+    for user_ids in _user_batches(batch_size, users):
+        latest = _latest(user_ids)
+        CurrentLoan.objects.bulk_create(
+            [CurrentLoan(user_id=user_id, book_id=book_id, loan_id=loan_id)
+             for (user_id, book_id), loan_id in latest.items()],
+            update_conflicts=True,
+            unique_fields=['user', 'book'],
+            update_fields=['loan'],
+        )
+        done += len(user_ids)
+        rows += len(latest)
+        if progress:
+            progress(done, rows)
+    return rows
+
+
+def check(batch_size=1000):
+    """
+    Compare CurrentLoan with the loan history. Returns a list of problems as
+    (user_id, book_id, expected loan id or None, current loan id or None).
+    """
+    problems = []
+    for user_ids in _user_batches(batch_size):
+        expected = _latest(user_ids)
+        actual = {
+            (user_id, book_id): loan_id
+            for user_id, book_id, loan_id in
+            CurrentLoan.objects.filter(user_id__in=user_ids).values_list('user_id', 'book_id', 'loan_id')
+        }
+        for key in expected.keys() | actual.keys():
+            if expected.get(key) != actual.get(key):
+                problems.append((*key, expected.get(key), actual.get(key)))
+    return problems
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from library import archive
+
+
+class Command(BaseCommand):
+    help = ('Move returned loans older than --months into the archive table in batches. '
+            'Safe to interrupt and re-run.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=12, help='Archive loans returned more than this many months ago.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Loans moved per transaction.')
+        parser.add_argument('--sleep', type=float, default=0.0, help='Seconds to pause between batches.')
+
+    def handle(self, *args, **options):
+        cutoff = archive.months_before(timezone.now().date(), options['months'])
+
+        def progress(moved):
+            self.stdout.write(f'Archived {moved} loans', ending='\r')
+            time.sleep(options['sleep'])
+
+        moved = archive.archive_loans(cutoff, batch_size=options['batch_size'], progress=progress)
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(f'Archived {moved} loans returned before {cutoff}.'))
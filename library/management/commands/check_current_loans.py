@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from library import loan_state
+
+# Mismatches printed before the summary
+MAX_REPORTED = 20
+
+
+class Command(BaseCommand):
+    help = 'Verify that the CurrentLoan table matches the loan history; fails if it does not.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Users checked per batch.')
+
+    def handle(self, *args, **options):
+        problems = loan_state.check(batch_size=options['batch_size'])
+
+        for user_id, book_id, expected, actual in problems[:MAX_REPORTED]:
+            self.stdout.write(f'user {user_id}, book {book_id}: expected loan {expected}, found {actual}')
+        if problems:
+            raise CommandError(f'{len(problems)} current loans are out of date; run rebuild_current_loans.')
+        self.stdout.write(self.style.SUCCESS('Current loans match the loan history.'))
@@ -0,0 +1,36 @@
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = ('Delete expired sessions in small batches, each in its own short transaction, '
+            'so the session table is never locked for long (unlike clearsessions).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Sessions deleted per statement.')
+        parser.add_argument('--sleep', type=float, default=0.1, help='Seconds to pause between batches.')
+
+    def handle(self, *args, **options):
+        store = import_module(settings.SESSION_ENGINE).SessionStore
+        if not hasattr(store, 'get_model_class'):
+            # Signed-cookie (and pure cache) sessions expire on their own
+            self.stdout.write(f'{settings.SESSION_ENGINE} keeps no session table; nothing to clean up.')
+            return
+
+        sessions = store.get_model_class().objects
+        now = timezone.now()
+        deleted = 0
+        while True:
+            # Walks the expire_date index; the keys keep each DELETE to one small batch
+            keys = list(sessions.filter(expire_date__lt=now).values_list('session_key', flat=True)[:options['batch_size']])
+            if not keys:
+                break
+            deleted += sessions.filter(session_key__in=keys).delete()[0]
+            self.stdout.write(f'Deleted {deleted} expired sessions', ending='\r')
+            time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired sessions.'))
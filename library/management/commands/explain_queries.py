@@ -0,0 +1,80 @@
+import re
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+
+from library import services
+from library.management.seed import require_scratch_database, seed
+from library.models import BookLoan
+
+# Plan fragments that mean a table is read front to back
+SEQ_SCAN_PATTERNS = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(r'\bSCAN (\w+)(?! USING (?:COVERING )?INDEX)'),
+}
+
+
+class Command(BaseCommand):
+    help = 'Run EXPLAIN on the hot BookLoan queries and fail if any of them does a sequential scan.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Insert this many synthetic loans before explaining (rolled back afterwards).')
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Rows per bulk insert while seeding.')
+        parser.add_argument('--allow-any-database', action='store_true',
+                            help='Seed even if the database is not local or a test database.')
+
+    def handle(self, *args, **options):
+        pattern = SEQ_SCAN_PATTERNS.get(connection.vendor)
+        if pattern is None:
+            raise CommandError(f'Unsupported database backend: {connection.vendor}')
+
+        if options['seed']:
+            require_scratch_database(options['allow_any_database'])
+
+        with transaction.atomic():
+            if options['seed']:
+                seed(books=options['seed'] // 1000, loans=options['seed'],
+                     batch_size=options['batch_size'], stdout=self.stdout)
+            failures = self.audit(pattern)
+            # Never keep the synthetic data
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError(f'Sequential scan in: {", ".join(failures)}')
+        self.stdout.write(self.style.SUCCESS('No sequential scans found.'))
+
+    def audit(self, pattern):
+        busiest = BookLoan.objects.values('user', 'book').annotate(n=Count('id')).order_by('-n').first()
+        if busiest is None:
+            raise CommandError('There are no loans to explain; use --seed.')
+        user = User.objects.get(id=busiest['user'])
+
+        queries = {
+            'open loan lookup': BookLoan.objects.filter(user=user, book_id=busiest['book'], return_date__isnull=True),
+            'latest loan per book': services.current_loans(user),
+        }
+
+        # Ignore scans of derived tables such as subqueries and CTEs
+        tables = set(connection.introspection.table_names())
+
+        failures = []
+        for name, queryset in queries.items():
+            plan = self.explain(queryset)
+            scans = [table for table in pattern.findall(plan) if table in tables]
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(plan)
+            if scans:
+                failures.append(f'{name} ({", ".join(sorted(set(scans)))})')
+        return failures
+
+    def explain(self, queryset):
+        # Built from the compiled SQL because QuerySet.explain() misplaces the
+        # EXPLAIN prefix for window-filtered queries on SQLite
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+            return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from library import bulk
+
+
+class Command(BaseCommand):
+    help = 'Stream the book catalog as CSV or JSON Lines.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=bulk.FORMATS, default='csv')
+        parser.add_argument('--output', help='File to write (default: standard output).')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched from the database at a time.')
+
+    def handle(self, *args, **options):
+        chunks = bulk.export_rows(options['format'], chunk_size=options['chunk_size'])
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                output.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
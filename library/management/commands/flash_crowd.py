@@ -0,0 +1,116 @@
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from library.management.seed import require_scratch_database
+from library.models import Book, BookLoan, Profile
+
+# Throttle counters go to a private, empty locmem cache so the run neither
+# reads nor leaves counters in the real one
+CROWD_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'flash-crowd'}}
+
+
+def percentile(values, q):
+    values = sorted(values) or [0]
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+class Command(BaseCommand):
+    help = ('Simulate a flash crowd: --users readers try to borrow one book with --stock copies at once '
+            'through the create-loan API. Reports responses by status and latency percentiles, and fails if '
+            'the book is oversold, a request errors, a 429 lacks Retry-After or the tail latency exceeds '
+            '--max-p99. The users and the book are deleted afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Readers in the crowd, one request each.')
+        parser.add_argument('--stock', type=int, default=10, help='Copies of the book.')
+        parser.add_argument('--threads', type=int, default=50, help='Requests in flight at once.')
+        parser.add_argument('--max-p99', type=float, default=2000.0,
+                            help='Fail if the 99th percentile response time exceeds this many milliseconds.')
+        parser.add_argument('--allow-any-database', action='store_true',
+                            help='Run even if the database is not local or a test database.')
+
+    def handle(self, *args, **options):
+        require_scratch_database(options['allow_any_database'])
+
+        responses, lent = self.run(options['users'], options['stock'], options['threads'])
+
+        statuses = Counter(status for status, _, _ in responses)
+        self.stdout.write('Responses: ' + ', '.join(f'{status}: {count}' for status, count in sorted(statuses.items())))
+        for label, codes in (('all', None), ('admitted', {201, 400}), ('throttled', {429})):
+            latencies = [seconds for status, seconds, _ in responses if codes is None or status in codes]
+            if latencies:
+                self.stdout.write(f'{label:<10} ' + '  '.join(
+                    f'{name} {percentile(latencies, q) * 1000:.1f} ms'
+                    for name, q in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99), ('max', 1))
+                ))
+
+        problems = self.problems(responses, statuses, options['stock'], *lent)
+        p99 = percentile([seconds for _, seconds, _ in responses], 0.99) * 1000
+        if p99 > options['max_p99']:
+            problems.append(f'p99 response time {p99:.1f} ms is over {options["max_p99"]:.0f} ms')
+        if problems:
+            raise CommandError('; '.join(problems))
+        self.stdout.write(self.style.SUCCESS('The crowd was served without overselling.'))
+
+    def run(self, users, stock, threads):
+        """Returns one (status code, seconds, Retry-After) per reader, and (copies taken, open loans)."""
+        suffix = timezone.now().strftime('%Y%m%d%H%M%S')
+        readers = User.objects.bulk_create([User(username=f'crowd-{suffix}-{n}', password='!') for n in range(users)])
+        Profile.objects.bulk_create([Profile(user=user) for user in readers])
+        book = Book.objects.create(title=f'Flash crowd {suffix}', author='Crowd', publication_year=2000, stock=stock)
+
+        responses = []
+        # Every 429 would otherwise log a warning
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.ERROR)
+        try:
+            with override_settings(CACHES=CROWD_CACHES):
+                caches['default'].clear()
+                chunks = [readers[n::threads] for n in range(threads)]
+                workers = [threading.Thread(target=self.borrow, args=(chunk, book.id, responses)) for chunk in chunks]
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    worker.join()
+
+            book.refresh_from_db()
+            lent = (stock - book.stock, BookLoan.objects.filter(book=book, return_date__isnull=True).count())
+        finally:
+            request_logger.setLevel(level)
+            book.delete()
+            User.objects.filter(id__in=[user.id for user in readers]).delete()
+        return responses, lent
+
+    def borrow(self, readers, book_id, responses):
+        client = APIClient()
+        try:
+            for reader in readers:
+                client.force_authenticate(reader)
+                started = time.perf_counter()
+                response = client.post('/api/loans/create-loan/', {'book_id': book_id}, format='json')
+                responses.append((response.status_code, time.perf_counter() - started, response.get('Retry-After')))
+        finally:
+            connection.close()
+
+    def problems(self, responses, statuses, stock, taken, open_loans):
+        problems = []
+        if statuses[201] > stock or taken != statuses[201] or open_loans != statuses[201]:
+            problems.append(f'{statuses[201]} loans created for {stock} copies (stock down by {taken}, '
+                            f'{open_loans} open loans)')
+        unexpected = sorted(status for status in statuses if status not in (201, 400, 429))
+        if unexpected:
+            problems.append(f'unexpected responses: {", ".join(map(str, unexpected))}')
+        if any(status == 429 and not retry_after for status, _, retry_after in responses):
+            problems.append('429 responses without Retry-After')
+        return problems
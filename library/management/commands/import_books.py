@@ -0,0 +1,42 @@
+import sys
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library import bulk
+
+
+class Command(BaseCommand):
+    help = 'Import or update books from a CSV or JSON Lines file, upserting on ISBN.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to read, or '-' for standard input.")
+        parser.add_argument('--format', choices=bulk.FORMATS,
+                            help='File format (default: guessed from the file extension, csv for stdin).')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows written per transaction.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('jsonl' if Path(path).suffix in ('.jsonl', '.ndjson') else 'csv')
+
+        if path == '-':
+            result = self.run(sys.stdin, file_format, options['batch_size'])
+        else:
+            try:
+                with open(path, encoding='utf-8-sig', newline='') as lines:
+                    result = self.run(lines, file_format, options['batch_size'])
+            except OSError as e:
+                raise CommandError(str(e))
+
+        for error in result.errors:
+            self.stderr.write(f"Row {error['row']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {result.created}, updated {result.updated}, skipped {result.invalid} invalid rows '
+            f'({result.rows_per_second} rows/s).'
+        ))
+
+    def run(self, lines, file_format, batch_size):
+        def progress(result):
+            self.stdout.write(f'{result.rows} rows ({result.rows_per_second} rows/s)', ending='\r')
+
+        return bulk.import_rows(bulk.read_rows(lines, file_format), batch_size=batch_size, progress=progress)
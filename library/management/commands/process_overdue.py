@@ -0,0 +1,28 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from library import overdue
+
+
+class Command(BaseCommand):
+    help = ("Write today's reminders for overdue loans, one per user. "
+            'Safe to interrupt and re-run: users already reminded today are skipped.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=date.fromisoformat, help='Day to process, YYYY-MM-DD (default: today).')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Notifications written per INSERT.')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Loans fetched from the database at a time.')
+
+    def handle(self, *args, **options):
+        today = options['date'] or timezone.now().date()
+
+        def progress(users, loans):
+            self.stdout.write(f'{users} users, {loans} overdue loans', ending='\r')
+
+        users, loans = overdue.process_overdue(
+            today, batch_size=options['batch_size'], chunk_size=options['chunk_size'], progress=progress,
+        )
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(f'Reminded {users} users about {loans} overdue loans.'))
@@ -0,0 +1,158 @@
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import get_resolver, reverse
+
+from library.management.seed import require_scratch_database, seed
+from library.models import CurrentLoan, Hold, Profile
+
+# Maximum SQL queries per route, including session and user lookups. Every named
+# route must be listed, and no count may change between data sizes.
+QUERY_BUDGETS = {
+    'home': 3,
+    'books': 3,
+    'detail_book': 3,
+    'borrow_book': 10,
+    'return_book': 7,
+    'create_book': 2,
+    'delete_book': 10,
+    'signin': 0,
+    'signup': 0,
+    'logout': 4,
+    'api-root': 2,
+    'metrics': 2,
+    'books-list': 3,
+    'books-detail': 3,
+    'books-search': 3,
+    'books-bulk-books': 3,
+    'books-cache-stats': 2,
+    'loans-list': 3,
+    'loans-detail': 3,
+    'loans-history': 4,
+    'loans-holds': 3,
+    'loans-cancel-hold': 3,
+    'loans-create-new-loan': 11,
+    'loans-return-loan': 7,
+    'loans-bulk-create-loans': 10,
+    'loans-bulk-return-loans': 9,
+}
+
+# Caches are swapped for a private, empty locmem cache so every request takes
+# the uncached path without touching the real cache
+AUDIT_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'query-budget'}}
+
+
+class Command(BaseCommand):
+    help = ('Seed a small and a large dataset (rolled back afterwards), request every route and fail if '
+            'a route exceeds its query budget or its query count grows with the data size.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--small', default='100/1000', help='BOOKS/LOANS for the small dataset.')
+        parser.add_argument('--large', default='10000/100000', help='BOOKS/LOANS for the large dataset.')
+        parser.add_argument('--allow-any-database', action='store_true',
+                            help='Seed even if the database is not local or a test database.')
+
+    def handle(self, *args, **options):
+        require_scratch_database(options['allow_any_database'])
+
+        missing = self.route_names() - set(QUERY_BUDGETS)
+        if missing:
+            raise CommandError(f'Routes without a query budget: {", ".join(sorted(missing))}')
+
+        sizes = {label: tuple(int(n) for n in options[label].split('/')) for label in ('small', 'large')}
+        counts = {label: self.measure(*size) for label, size in sizes.items()}
+
+        failures = []
+        self.stdout.write(f'{"route":<28}{"small":>7}{"large":>7}{"budget":>8}')
+        for route, budget in QUERY_BUDGETS.items():
+            small, large = counts['small'][route], counts['large'][route]
+            problems = []
+            if large != small:
+                problems.append('grows with data')
+            if large > budget:
+                problems.append('over budget')
+            line = f'{route:<28}{small:>7}{large:>7}{budget:>8}  {", ".join(problems)}'
+            self.stdout.write(self.style.ERROR(line) if problems else line)
+            if problems:
+                failures.append(route)
+
+        if failures:
+            raise CommandError(f'Query budget exceeded: {", ".join(failures)}')
+        self.stdout.write(self.style.SUCCESS('All routes are within their query budgets.'))
+
+    def route_names(self):
+        return {name for name in get_resolver().reverse_dict if isinstance(name, str)}
+
+    def measure(self, books, loans):
+        with override_settings(CACHES=AUDIT_CACHES), transaction.atomic():
+            user = User.objects.create_user(username='query-budget-user', password='!')
+            Profile.objects.create(user=user)
+            admin = User.objects.create_user(username='query-budget-admin', password='!')
+            Profile.objects.create(user=admin, role='admin')
+
+            self.stdout.write(f'Seeding {books} books and {loans} loans')
+            seeded = seed(books=books, loans=loans, owner=user, owner_share=0.1, stdout=self.stdout)
+            counts = self.run_routes(user, admin, seeded)
+
+            # Never keep the synthetic data
+            transaction.set_rollback(True)
+        return counts
+
+    def run_routes(self, user, admin, books):
+        user_client, admin_client, anonymous = Client(), Client(), Client()
+        user_client.force_login(user)
+        admin_client.force_login(admin)
+        book, spare = books[0], books[-1]
+        # A loan the borrow/return requests below won't replace
+        loan = CurrentLoan.objects.filter(user=user).exclude(book__in=books[:4]).first().loan
+        hold = Hold.objects.create(user=user, book=books[4])
+        operations = {'operations': [{'user_id': user.id, 'book_id': b.id} for b in books[1:4]]}
+
+        # (route, client, method, url kwargs, query string or JSON body)
+        requests = [
+            ('home', user_client, 'get', {}, None),
+            ('books', user_client, 'get', {}, None),
+            ('detail_book', user_client, 'get', {'book_id': book.id}, None),
+            ('borrow_book', user_client, 'get', {'book_id': book.id}, None),
+            ('return_book', user_client, 'get', {'book_id': book.id}, None),
+            ('create_book', admin_client, 'get', {}, None),
+            ('delete_book', admin_client, 'post', {'book_id': spare.id}, None),
+            ('signin', anonymous, 'get', {}, None),
+            ('signup', anonymous, 'get', {}, None),
+            ('api-root', user_client, 'get', {}, None),
+            ('metrics', admin_client, 'get', {}, None),
+            ('books-list', user_client, 'get', {}, None),
+            ('books-detail', user_client, 'get', {'pk': book.id}, None),
+            ('books-search', user_client, 'get', {}, {'q': 'Seed'}),
+            ('books-bulk-books', user_client, 'get', {}, None),
+            ('books-cache-stats', admin_client, 'get', {}, None),
+            ('loans-list', user_client, 'get', {}, None),
+            ('loans-detail', user_client, 'get', {'pk': loan.id}, None),
+            ('loans-history', user_client, 'get', {}, None),
+            ('loans-holds', user_client, 'get', {}, None),
+            ('loans-cancel-hold', user_client, 'post', {}, {'book_id': hold.book_id}),
+            ('loans-create-new-loan', user_client, 'post', {}, {'book_id': book.id}),
+            ('loans-return-loan', user_client, 'post', {}, {'book_id': book.id}),
+            ('loans-bulk-create-loans', admin_client, 'post', {}, operations),
+            ('loans-bulk-return-loans', admin_client, 'post', {}, operations),
+            ('logout', user_client, 'get', {}, None),
+        ]
+
+        counts = {}
+        for route, client, method, kwargs, data in requests:
+            caches['default'].clear()
+            url = reverse(route, kwargs=kwargs)
+            with CaptureQueriesContext(connection) as queries:
+                if method == 'get':
+                    response = client.get(url, data)
+                else:
+                    response = client.post(url, data, content_type='application/json')
+                # Drain streaming responses so their queries are counted
+                b''.join(response.streaming_content) if response.streaming else response.content
+            if response.status_code >= 400:
+                raise CommandError(f'{route} returned {response.status_code}')
+            counts[route] = len(queries.captured_queries)
+        return counts
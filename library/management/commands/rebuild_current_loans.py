@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from library import loan_state
+
+
+class Command(BaseCommand):
+    help = 'Recompute the CurrentLoan table (latest loan per user and book) from the loan history.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Users processed per batch.')
+
+    def handle(self, *args, **options):
+        def progress(users, rows):
+            self.stdout.write(f'{users} users, {rows} current loans', ending='\r')
+
+        rows = loan_state.rebuild(batch_size=options['batch_size'], progress=progress)
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} current loans.'))
@@ -0,0 +1,95 @@
+import asyncio
+import statistics
+import subprocess
+import sys
+import time
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from library.backends import AsyncRemoteBackend, RemoteBackend
+from library.services import ServiceError
+
+# The call every remote-mode page makes: the user's current loans
+PATH = '/api/loans/'
+
+
+class Command(BaseCommand):
+    help = ('Serve a stub REST API on localhost that answers after --latency milliseconds and compare '
+            'requests/sec of one worker in each remote mode: sync with a new connection per call (the '
+            'old requests.get), sync with the pooled session, and async with the shared httpx client.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=5.0, help='How long to load each mode.')
+        parser.add_argument('--latency', type=float, default=50.0, help='Stub API response time in milliseconds.')
+        parser.add_argument('--concurrency', type=int, default=50,
+                            help='Requests in flight at once on the async worker.')
+
+    def handle(self, *args, **options):
+        results = self.run(options['seconds'], options['latency'], options['concurrency'])
+
+        self.stdout.write(f'{"mode":<22}{"requests":>10}{"errors":>8}{"req/s":>9}{"p50 ms":>9}{"p99 ms":>9}')
+        for mode, result in results.items():
+            latencies = sorted(result['latencies']) or [0]
+            self.stdout.write(
+                f'{mode:<22}{len(result["latencies"]):>10}{result["errors"]:>8}{result["rate"]:>9.1f}'
+                f'{statistics.median(latencies) * 1000:>9.1f}{latencies[int(len(latencies) * 0.99)] * 1000:>9.1f}'
+            )
+
+    def run(self, seconds, latency, concurrency):
+        """Load each mode for `seconds` against a fresh stub; returns {mode: {'rate', 'errors', 'latencies'}}."""
+        stub = subprocess.Popen([sys.executable, '-m', 'library.management.stub_api', str(latency)],
+                                stdout=subprocess.PIPE, text=True, cwd=settings.BASE_DIR)
+        try:
+            base_url = f'http://127.0.0.1:{stub.stdout.readline().strip()}'
+            request = RequestFactory().get('/')
+            sync_backend = type('StubBackend', (RemoteBackend,), {'base_url': base_url})(request)
+            async_backend = type('AsyncStubBackend', (AsyncRemoteBackend,), {'base_url': base_url})(request)
+
+            return {
+                'sync, no pooling': self.measure_sync(lambda: requests.get(f'{base_url}{PATH}', timeout=10), seconds),
+                'sync, pooled session': self.measure_sync(lambda: sync_backend._send('GET', PATH, 200), seconds),
+                'async, shared client': asyncio.run(self.measure_async(async_backend, seconds, concurrency)),
+            }
+        finally:
+            stub.kill()
+            stub.wait()
+
+    def measure_sync(self, call, seconds):
+        # A sync worker serves one request at a time
+        latencies, errors = [], 0
+        started = time.perf_counter()
+        while time.perf_counter() - started < seconds:
+            call_started = time.perf_counter()
+            try:
+                call()
+            except (ServiceError, requests.RequestException):
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - call_started)
+        return {'rate': len(latencies) / (time.perf_counter() - started), 'errors': errors, 'latencies': latencies}
+
+    async def measure_async(self, backend, seconds, concurrency):
+        # One event loop with `concurrency` requests in flight
+        latencies, errors = [], 0
+        started = time.perf_counter()
+
+        async def user():
+            nonlocal errors
+            while time.perf_counter() - started < seconds:
+                call_started = time.perf_counter()
+                try:
+                    await backend._send('GET', PATH, 200)
+                except ServiceError:
+                    errors += 1
+                else:
+                    latencies.append(time.perf_counter() - call_started)
+
+        try:
+            await asyncio.gather(*(user() for _ in range(concurrency)))
+        finally:
+            await backend._client()[0].aclose()
+            type(backend)._clients.clear()
+        return {'rate': len(latencies) / (time.perf_counter() - started), 'errors': errors, 'latencies': latencies}
@@ -0,0 +1,84 @@
+"""
+Synthetic catalog and loan history for the audit commands (explain_queries,
+query_budget). Callers run it inside a transaction they roll back, after
+require_scratch_database(): the long seeding transaction holds row locks that
+would block real borrows on a live database.
+"""
+import random
+
+from django.contrib.auth.models import User
+from django.core.management.base import CommandError
+from django.db import connection
+from django.utils import timezone
+
+from library import loan_state
+from library.models import Book, BookLoan, Profile
+
+
+# Hosts that can only be a developer's own database server
+LOCAL_HOSTS = {'', 'localhost', '127.0.0.1', '::1'}
+
+
+def is_scratch_database(conn=connection):
+    """SQLite, a test database, or a server on this machine."""
+    settings_dict = conn.settings_dict
+    return (
+        conn.vendor == 'sqlite'
+        or str(settings_dict['NAME']).startswith('test_')
+        or settings_dict.get('HOST', '') in LOCAL_HOSTS
+    )
+
+
+def require_scratch_database(allow_any=False, conn=connection):
+    """Raise CommandError unless the database is a scratch one or the caller insists (--allow-any-database)."""
+    if not allow_any and not is_scratch_database(conn):
+        raise CommandError(
+            f'Refusing to seed synthetic data into {conn.settings_dict["NAME"]} on {conn.settings_dict["HOST"]}; '
+            'point DB_HOST at a local or test database, or pass --allow-any-database.'
+        )
+
+
+def seed(books, loans, batch_size=10000, owner=None, owner_share=0.0, stdout=None):
+    """
+    Bulk insert `books` books and `loans` returned loans spread over synthetic
+    users (one per 100 loans). If `owner` is given, that user gets roughly
+    `owner_share` of the loans. Returns the created books.
+    """
+    rng = random.Random(0)
+    suffix = timezone.now().strftime('%Y%m%d%H%M%S')
+
+    users = User.objects.bulk_create(
+        [User(username=f'seed-{suffix}-{i}', password='!') for i in range(max(1, loans // 100))],
+        batch_size=batch_size,
+    )
+    Profile.objects.bulk_create([Profile(user=user) for user in users], batch_size=batch_size)
+    created_books = Book.objects.bulk_create(
+        [Book(title=f'Seed {i}', author=f'Author {i % 1000}', abstract='Seeded book', publication_year=2000, stock=5)
+         for i in range(max(1, books))],
+        batch_size=batch_size,
+    )
+    user_ids = [user.id for user in users]
+    book_ids = [book.id for book in created_books]
+    today = timezone.now().date()
+
+    for start in range(0, loans, batch_size):
+        BookLoan.objects.bulk_create([
+            BookLoan(
+                user_id=owner.id if owner and rng.random() < owner_share else rng.choice(user_ids),
+                book_id=rng.choice(book_ids),
+                return_date=today,
+            )
+            for _ in range(min(batch_size, loans - start))
+        ])
+        if stdout:
+            stdout.write(f'Seeded {min(start + batch_size, loans)}/{loans} loans', ending='\r')
+    if stdout:
+        stdout.write('')
+    # Only the users whose loans were just added
+    loan_state.rebuild(users=[*user_ids, *([owner.id] if owner else [])])
+
+    # Refresh planner statistics so plans reflect the seeded volume
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+    return created_books
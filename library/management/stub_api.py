@@ -0,0 +1,46 @@
+"""
+A stand-in for the REST API that answers every GET with an empty JSON list
+after a fixed delay, for the remote_load_test command.
+
+Run as `python -m library.management.stub_api LATENCY_MS`. It prints the port
+it listens on and serves until killed. It runs in its own process so the
+client being measured doesn't share the GIL with it, and imports nothing
+from Django.
+"""
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BODY = b'[]'
+
+
+class StubAPIHandler(BaseHTTPRequestHandler):
+    # Keep-alive, like the real API behind gunicorn. Headers and body are
+    # separate writes, so without TCP_NODELAY a reused connection waits for
+    # the client's delayed ACK on every response
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    latency = 0.05
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubAPIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+if __name__ == '__main__':
+    StubAPIHandler.latency = float(sys.argv[1]) / 1000
+    server = StubAPIServer(('127.0.0.1', 0), StubAPIHandler)
+    print(server.server_address[1], flush=True)
+    server.serve_forever()
@@ -0,0 +1,236 @@
+"""
+Per-request performance metrics.
+
+MetricsMiddleware measures every request and attributes it to its route (the
+URL name, e.g. "home" or "books-list"). While a request runs, the pieces below
+add to its sample through a context variable:
+
+- DB queries and time: an execute wrapper installed on every new connection
+- outbound HTTP calls and time: track_http() in library.backends
+- serializer time: TimedSerializerMixin in api.serializers
+- template render time: the InstrumentedTemplates backend
+
+The last METRICS_BUFFER_SIZE samples per route are kept in memory and turned
+into p50/p95/p99 summaries by render_prometheus() for /api/metrics/. Recording
+a request costs a few perf_counter() calls and a deque append.
+"""
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.template.backends.django import DjangoTemplates
+
+from . import catalog_cache
+
+# Measurements collected for each request, in sample tuple order
+FIELDS = (
+    ('request_seconds', 'Total request latency in seconds'),
+    ('db_queries', 'SQL queries per request'),
+    ('db_seconds', 'Time spent in SQL queries per request'),
+    ('http_requests', 'Outbound HTTP calls per request'),
+    ('http_seconds', 'Time spent in outbound HTTP calls per request'),
+    ('serializer_seconds', 'Time spent in DRF serializers per request'),
+    ('template_seconds', 'Time spent rendering templates per request'),
+)
+QUANTILES = (0.5, 0.95, 0.99)
+
+_current = contextvars.ContextVar('library_metrics_sample', default=None)
+
+_samples = {}
+_totals = {}
+_lock = threading.Lock()
+
+
+class Sample:
+    __slots__ = ('db_queries', 'db_seconds', 'http_requests', 'http_seconds',
+                 'serializer_seconds', 'serializer_depth', 'template_seconds')
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.http_requests = 0
+        self.http_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.serializer_depth = 0
+        self.template_seconds = 0.0
+
+
+def record(route, sample, elapsed):
+    values = (elapsed, sample.db_queries, sample.db_seconds, sample.http_requests,
+              sample.http_seconds, sample.serializer_seconds, sample.template_seconds)
+    with _lock:
+        if route not in _samples:
+            _samples[route] = deque(maxlen=getattr(settings, 'METRICS_BUFFER_SIZE', 1024))
+            _totals[route] = [0, [0.0] * len(FIELDS)]
+        _samples[route].append(values)
+        totals = _totals[route]
+        totals[0] += 1
+        for index, value in enumerate(values):
+            totals[1][index] += value
+
+
+class MetricsMiddleware:
+    # Runs natively on both stacks, so ASGI requests to async views aren't
+    # pushed through async_to_sync here
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        sample = Sample()
+        token = _current.set(sample)
+        started = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            self.finish(request, sample, token, started)
+
+    async def __acall__(self, request):
+        # sync_to_async copies the context, so ORM calls in threads still count
+        sample = Sample()
+        token = _current.set(sample)
+        started = time.perf_counter()
+        try:
+            return await self.get_response(request)
+        finally:
+            self.finish(request, sample, token, started)
+
+    def finish(self, request, sample, token, started):
+        elapsed = time.perf_counter() - started
+        _current.reset(token)
+        match = request.resolver_match
+        record(match.view_name if match and match.view_name else 'unmatched', sample, elapsed)
+
+
+# DB queries
+
+def _db_wrapper(execute, sql, params, many, context):
+    sample = _current.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        sample.db_queries += 1
+        sample.db_seconds += time.perf_counter() - started
+
+
+def install_db_wrapper(sender, connection, **kwargs):
+    """connection_created receiver, connected in LibraryConfig.ready()."""
+    if _db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_db_wrapper)
+
+
+# Outbound HTTP
+
+@contextmanager
+def track_http():
+    sample = _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if sample is not None:
+            sample.http_requests += 1
+            sample.http_seconds += time.perf_counter() - started
+
+
+# Serializers
+
+@contextmanager
+def track_serializer():
+    sample = _current.get()
+    if sample is None or sample.serializer_depth:
+        # Nested serializers are already inside the outer measurement
+        yield
+        return
+
+    sample.serializer_depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        sample.serializer_seconds += time.perf_counter() - started
+        sample.serializer_depth -= 1
+
+
+# Templates
+
+class InstrumentedTemplates(DjangoTemplates):
+    """The standard Django template backend, timing every render."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+class TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        sample = _current.get()
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            if sample is not None:
+                sample.template_seconds += time.perf_counter() - started
+
+
+# Exposition
+
+def _quantile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def render_prometheus():
+    """Return all metrics in the Prometheus text exposition format."""
+    with _lock:
+        samples = {route: list(buffer) for route, buffer in _samples.items()}
+        totals = {route: (count, list(sums)) for route, (count, sums) in _totals.items()}
+
+    lines = []
+    for index, (name, description) in enumerate(FIELDS):
+        metric = f'library_{name}'
+        lines.append(f'# HELP {metric} {description}')
+        lines.append(f'# TYPE {metric} summary')
+        for route in sorted(samples):
+            label = _label(route)
+            ordered = sorted(values[index] for values in samples[route])
+            for q in QUANTILES:
+                lines.append(f'{metric}{{route="{label}",quantile="{q}"}} {_quantile(ordered, q):g}')
+            count, sums = totals[route]
+            lines.append(f'{metric}_sum{{route="{label}"}} {sums[index]:g}')
+            lines.append(f'{metric}_count{{route="{label}"}} {count}')
+
+    for name, value in catalog_cache.stats().items():
+        lines.append(f'# TYPE library_catalog_cache_{name}_total counter')
+        lines.append(f'library_catalog_cache_{name}_total {value}')
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,35 @@
+"""
+WhiteNoise static file serving that also runs natively under ASGI.
+
+whitenoise.middleware.WhiteNoiseMiddleware is sync-only, so Django adapts it
+with async_to_sync under ASGI and every async view behind it ends up running
+on a blocked thread. This subclass keeps WhiteNoise's behaviour on WSGI and
+adds an async path: static files are looked up and opened in a thread, and
+all other requests are awaited straight through to the next middleware.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from whitenoise.middleware import WhiteNoiseMiddleware as BaseWhiteNoiseMiddleware
+
+
+class WhiteNoiseMiddleware(BaseWhiteNoiseMiddleware):
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
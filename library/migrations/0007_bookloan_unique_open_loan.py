@@ -0,0 +1,43 @@
+# Generated by Django 5.2.2 on 2026-10-18 18:45
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def close_duplicate_open_loans(apps, schema_editor):
+    # The old read-check-write borrow could open the same book twice for a user
+    # under concurrent requests. Keep the earliest open loan of each pair and
+    # close the others on their own loan date, so the constraint can be added.
+    # Stock is left alone: whether the racing borrows both decremented it
+    # can't be told from the rows.
+    BookLoan = apps.get_model('library', 'BookLoan')
+    duplicates = (
+        BookLoan.objects.filter(return_date__isnull=True)
+        .values('user_id', 'book_id')
+        .annotate(n=Count('id'), keep=Min('id'))
+        .filter(n__gt=1)
+        .order_by()
+    )
+    for row in duplicates.iterator():
+        for loan in BookLoan.objects.filter(
+            user_id=row['user_id'], book_id=row['book_id'], return_date__isnull=True,
+        ).exclude(id=row['keep']).only('id', 'loan_date'):
+            loan.return_date = loan.loan_date
+            loan.save(update_fields=['return_date'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0006_book_abstract'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(close_duplicate_open_loans, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='bookloan',
+            constraint=models.UniqueConstraint(condition=models.Q(('return_date__isnull', True)), fields=('user', 'book'), name='unique_open_loan'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.2 on 2026-10-18 18:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0007_bookloan_unique_open_loan'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookloan',
+            index=models.Index(fields=['user', 'book', '-id'], name='bookloan_user_book_latest'),
+        ),
+    ]
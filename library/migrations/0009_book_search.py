@@ -0,0 +1,24 @@
+# Full-text search structures for Book; see library/search.py
+
+from django.db import migrations
+
+from library import search
+
+
+def install_search(apps, schema_editor):
+    search.install(schema_editor.connection)
+
+
+def uninstall_search(apps, schema_editor):
+    search.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0008_bookloan_bookloan_user_book_latest'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search, uninstall_search),
+    ]
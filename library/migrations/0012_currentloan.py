@@ -0,0 +1,46 @@
+# Generated by Django 5.2.2 on 2026-10-18 19:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def populate(apps, schema_editor):
+    # Same as library.loan_state.rebuild(), with the historical models
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    BookLoan = apps.get_model('library', 'BookLoan')
+    CurrentLoan = apps.get_model('library', 'CurrentLoan')
+
+    last_id = 0
+    while True:
+        user_ids = list(User.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:1000])
+        if not user_ids:
+            return
+        latest = BookLoan.objects.filter(user_id__in=user_ids).values('user_id', 'book_id').annotate(loan_id=Max('id')).order_by()
+        CurrentLoan.objects.bulk_create([CurrentLoan(**row) for row in latest])
+        last_id = user_ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0011_book_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurrentLoan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='library.book')),
+                ('loan', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='current', to='library.bookloan')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'book'), name='unique_current_loan')],
+            },
+        ),
+        migrations.RunPython(populate, migrations.RunPython.noop),
+    ]
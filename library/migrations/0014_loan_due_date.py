@@ -0,0 +1,68 @@
+# Generated by Django 5.2.2 on 2026-10-18 19:06
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def set_due_dates(apps, schema_editor):
+    # Open loans get the regular loan period from their loan date
+    BookLoan = apps.get_model('library', 'BookLoan')
+    days = timedelta(days=getattr(settings, 'LOAN_DAYS', {}).get('regular', 14))
+
+    loans = BookLoan.objects.filter(return_date__isnull=True, due_date__isnull=True).only('id', 'loan_date')
+    batch = []
+    for loan in loans.iterator(chunk_size=2000):
+        loan.due_date = loan.loan_date + days
+        batch.append(loan)
+        if len(batch) >= 2000:
+            BookLoan.objects.bulk_update(batch, ['due_date'])
+            batch = []
+    BookLoan.objects.bulk_update(batch, ['due_date'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0013_archivedloan'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('overdue', 'Overdue reminder')], max_length=20)),
+                ('created_on', models.DateField()),
+                ('message', models.TextField()),
+                ('read', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='loan_days',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='bookloan',
+            name='due_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='bookloan',
+            index=models.Index(condition=models.Q(('return_date__isnull', True)), fields=['user', 'due_date'], name='bookloan_open_due'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(fields=('user', 'kind', 'created_on'), name='unique_daily_notification'),
+        ),
+        migrations.RunPython(set_due_dates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.2 on 2026-10-18 19:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0015_hold'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='book',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.2 on 2026-10-18 19:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0016_book_version_not_editable'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedloan',
+            name='due_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+    ]
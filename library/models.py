@@ -15,17 +15,32 @@ class Profile(models.Model):
 
 # Represents a book in the system
 class Book(models.Model):
+    isbn = models.CharField(max_length=13, unique=True, null=True, blank=True)  # Natural key used by bulk imports
     title = models.CharField(max_length=200)              # Title of the book
     author = models.CharField(max_length=100)             # Author name
     abstract = models.TextField(null=True, blank=True)    # Optional description or summary
     publication_year = models.PositiveIntegerField()      # Year of publication
     stock = models.PositiveIntegerField()                 # Number of available copies
+    version = models.PositiveIntegerField(default=1, editable=False)  # Bumped on every write, for optimistic concurrency
+    loan_days = models.PositiveIntegerField(null=True, blank=True)  # Loan period; LOAN_DAYS by role when empty
     borrowed_by = models.ManyToManyField(
         User,
         through='BookLoan',                               # Link to BookLoan model
         related_name='borrowed_books'                     # Enables user.borrowed_books
     )
 
+    def save(self, *args, **kwargs):
+        # Writes through save() (e.g. the admin site) bump the version in the
+        # database too, so optimistic concurrency and cached cards see them
+        bump = not self._state.adding
+        if bump:
+            self.version = models.F('version') + 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        super().save(*args, **kwargs)
+        if bump:
+            self.refresh_from_db(fields=['version'])
+
     def __str__(self):
         return f"{self.title} - {self.publication_year}"  # Display format
 
@@ -35,6 +50,100 @@ class BookLoan(models.Model):
     book = models.ForeignKey(Book, on_delete=models.CASCADE)  # Book being borrowed
     loan_date = models.DateField(auto_now_add=True)           # Date when loan was created
     return_date = models.DateField(null=True, blank=True)     # Optional return date
+    due_date = models.DateField(null=True, blank=True)        # Set from the loan period when borrowed
+
+    class Meta:
+        constraints = [
+            # A user can hold at most one open (not returned) loan per book
+            models.UniqueConstraint(
+                fields=['user', 'book'],
+                condition=models.Q(return_date__isnull=True),
+                name='unique_open_loan',
+            ),
+        ]
+        indexes = [
+            # Latest loan per (user, book): LoansViewSet.get_queryset orders by -id.
+            # Open-loan lookups are served by the partial index behind unique_open_loan.
+            models.Index(fields=['user', 'book', '-id'], name='bookloan_user_book_latest'),
+            # Overdue open loans grouped by user (library.overdue), without touching returned loans
+            models.Index(
+                fields=['user', 'due_date'],
+                condition=models.Q(return_date__isnull=True),
+                name='bookloan_open_due',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.book.title}"     # Display format
+
+# Latest loan per (user, book), kept in step with BookLoan by library.services so
+# the "My Books" page is one indexed lookup instead of a scan of the loan history
+class CurrentLoan(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)                 # Borrower
+    book = models.ForeignKey(Book, on_delete=models.CASCADE)                 # Borrowed book
+    loan = models.OneToOneField(BookLoan, on_delete=models.CASCADE, related_name='current')  # Their latest loan
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'book'], name='unique_current_loan'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.book_id}: {self.loan_id}"  # Display format
+
+# Returned loans moved out of BookLoan by the archive_loans command, ids unchanged
+class ArchivedLoan(models.Model):
+    id = models.BigIntegerField(primary_key=True)                                   # Original BookLoan id
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')     # User who borrowed the book
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')     # Book that was borrowed
+    loan_date = models.DateField()                                                 # Date when loan was created
+    return_date = models.DateField()                                               # Date when it was returned
+    due_date = models.DateField(null=True, blank=True)                             # Due date it had while open
+
+    class Meta:
+        indexes = [
+            # A user's history, newest first (services.loan_history)
+            models.Index(fields=['user', '-id'], name='archivedloan_user_latest'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.book_id} (archived)"  # Display format
+
+# A user waiting for an out-of-stock book; served first come, first served
+class Hold(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)      # User waiting for the book
+    book = models.ForeignKey(Book, on_delete=models.CASCADE)      # Book they are waiting for
+    created_at = models.DateTimeField(auto_now_add=True)          # When they joined the queue
+
+    class Meta:
+        constraints = [
+            # One place in the queue per user and book
+            models.UniqueConstraint(fields=['user', 'book'], name='unique_hold'),
+        ]
+        indexes = [
+            # Queue order (ids only grow) and positions within a book's queue
+            models.Index(fields=['book', 'id'], name='hold_queue'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} waiting for {self.book.title}"  # Display format
+
+# Message for a user, e.g. the daily overdue reminder written by process_overdue
+class Notification(models.Model):
+    KIND_CHOICES = (
+        ('overdue', 'Overdue reminder'),
+    )
+    user = models.ForeignKey(User, on_delete=models.CASCADE)           # Recipient
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)       # What the notification is about
+    created_on = models.DateField()                                    # Day it was written for
+    message = models.TextField()                                       # Text shown to the user
+    read = models.BooleanField(default=False)                          # Dismissed by the user
+
+    class Meta:
+        constraints = [
+            # At most one notification of each kind per user and day, so jobs can safely re-run
+            models.UniqueConstraint(fields=['user', 'kind', 'created_on'], name='unique_daily_notification'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.kind} ({self.created_on})"  # Display format
@@ -0,0 +1,66 @@
+"""
+Overdue loan detection and daily reminders.
+
+process_overdue() streams open loans past their due date in user order, off
+the partial (user, due_date) index, and writes one reminder per user and day
+in bulk. Memory stays bounded by the batch size whatever the number of loans.
+Batches end at user boundaries and commit in user order, so the run can be
+resumed from the last user notified that day. The unique (user, kind, day)
+constraint makes re-runs write nothing twice.
+"""
+from itertools import groupby
+
+from django.db.models import Max
+
+from .models import BookLoan, Notification
+
+# Titles listed in one reminder; the rest are summarized as "and N more"
+MAX_LISTED = 20
+
+
+def overdue_loans(today):
+    return BookLoan.objects.filter(return_date__isnull=True, due_date__lt=today)
+
+
+def _message(listed, count):
+    titles = ', '.join(f'{title} (due {due_date})' for _, title, due_date in listed)
+    more = f' and {count - len(listed)} more' if count > len(listed) else ''
+    return f'You have {count} overdue book{"s" if count > 1 else ""}: {titles}{more}.'
+
+
+def process_overdue(today, batch_size=1000, chunk_size=2000, progress=None):
+    """
+    Write today's overdue reminders. Returns (users notified, overdue loans
+    seen); `progress(users, loans)` is called after every batch.
+    """
+    done = Notification.objects.filter(kind='overdue', created_on=today).aggregate(last=Max('user_id'))['last'] or 0
+    rows = (
+        overdue_loans(today).filter(user_id__gt=done)
+        .order_by('user_id', 'due_date')
+        .values_list('user_id', 'book__title', 'due_date')
+        .iterator(chunk_size=chunk_size)
+    )
+
+    users = loans = 0
+    batch = []
+    for user_id, user_loans in groupby(rows, key=lambda row: row[0]):
+        # Only the listed titles are kept; the rest are just counted
+        listed, count = [], 0
+        for row in user_loans:
+            if count < MAX_LISTED:
+                listed.append(row)
+            count += 1
+        batch.append(Notification(user_id=user_id, kind='overdue', created_on=today, message=_message(listed, count)))
+        users += 1
+        loans += count
+
+        if len(batch) >= batch_size:
+            Notification.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+            if progress:
+                progress(users, loans)
+
+    Notification.objects.bulk_create(batch, ignore_conflicts=True)
+    if progress:
+        progress(users, loans)
+    return users, loans
@@ -0,0 +1,69 @@
+"""
+Lookup of the current user's Profile.role.
+
+ProfileBackend loads the session user together with their Profile
+(select_related), so the role arrives with the user query AuthenticationMiddleware
+already makes and templates and DRF permission checks never query Profile. The
+role is read fresh on every request, so a changed Profile.role takes effect on
+the user's next request in every worker, with nothing to invalidate.
+"""
+from functools import wraps
+
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.core.exceptions import PermissionDenied
+from django.utils.functional import SimpleLazyObject
+
+from .models import Profile
+
+ADMIN = 'admin'
+REGULAR = 'regular'
+
+
+class ProfileBackend(ModelBackend):
+    """ModelBackend that loads the session user with their Profile in the same query."""
+
+    def get_user(self, user_id):
+        try:
+            user = User._default_manager.select_related('profile').get(pk=user_id)
+        except User.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
+
+
+def role_for(user):
+    """Return the user's role ('admin', 'regular'), or None if anonymous or without a Profile."""
+    if not user.is_authenticated:
+        return None
+
+    # Already loaded by ProfileBackend or select_related('user__profile'); one
+    # query otherwise, cached on the user object for the rest of the request
+    try:
+        return user.profile.role
+    except Profile.DoesNotExist:
+        return None
+
+
+def is_admin(user):
+    return role_for(user) == ADMIN
+
+
+def admin_required(view):
+    """View decorator answering 403 to anyone but library admins; pair it with login_required."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not is_admin(request.user):
+            raise PermissionDenied
+        return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def context_processor(request):
+    """Expose `user_role` and `user_role_display` to templates, evaluated on first use."""
+    role = SimpleLazyObject(lambda: role_for(request.user) or '')
+    return {
+        'user_role': role,
+        'user_role_display': SimpleLazyObject(lambda: dict(Profile.ROLE_CHOICES).get(str(role), '')),
+    }
+
@@ -0,0 +1,49 @@
+"""
+Database router that sends selected reads to the 'replica' database.
+
+Nothing is routed to the replica by default. Code that can tolerate
+replication lag opts in with `with read_from_replica():` (BookViewSet list and
+retrieve do). Everything else, and every write, uses 'default'. Without a
+'replica' entry in DATABASES the router is a no-op.
+
+Data changed within the last REPLICA_MAX_LAG seconds is still read from the
+primary, so a lagging replica can't put rows older than a cache key's version
+into the catalog cache.
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+
+_replica = contextvars.ContextVar('library_read_from_replica', default=False)
+
+
+@contextmanager
+def read_from_replica(changed_at):
+    """Route reads in the block to the replica; `changed_at` is the data's library.versions timestamp."""
+    lag = time.time_ns() - changed_at
+    token = _replica.set(lag > getattr(settings, 'REPLICA_MAX_LAG', 2) * 1_000_000_000)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # Inside a transaction on the primary, read your own writes
+        if _replica.get() and 'replica' in settings.DATABASES and not transaction.get_connection('default').in_atomic_block:
+            return 'replica'
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both databases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -0,0 +1,132 @@
+"""
+Full-text search over the book catalog.
+
+PostgreSQL: a stored, generated tsvector column (title weighted over author over
+abstract) with a GIN index, plus a pg_trgm index on author for fuzzy matches.
+SQLite: an external-content FTS5 table kept in sync by triggers, for local runs.
+
+The search structures live outside the Django model so that regular catalog
+queries never load the tsvector column.
+"""
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+POSTGRES_INSTALL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    ALTER TABLE library_book ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(author, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(abstract, '')), 'C')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS library_book_search_vector ON library_book USING gin (search_vector)",
+    "CREATE INDEX IF NOT EXISTS library_book_author_trgm ON library_book USING gin (author gin_trgm_ops)",
+]
+
+POSTGRES_UNINSTALL = [
+    "DROP INDEX IF EXISTS library_book_author_trgm",
+    "DROP INDEX IF EXISTS library_book_search_vector",
+    "ALTER TABLE library_book DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_INSTALL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS library_book_fts USING fts5(
+        title, author, abstract, content='library_book', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS library_book_fts_ai AFTER INSERT ON library_book BEGIN
+        INSERT INTO library_book_fts(rowid, title, author, abstract)
+        VALUES (new.id, new.title, new.author, new.abstract);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS library_book_fts_ad AFTER DELETE ON library_book BEGIN
+        INSERT INTO library_book_fts(library_book_fts, rowid, title, author, abstract)
+        VALUES ('delete', old.id, old.title, old.author, old.abstract);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS library_book_fts_au AFTER UPDATE OF title, author, abstract ON library_book BEGIN
+        INSERT INTO library_book_fts(library_book_fts, rowid, title, author, abstract)
+        VALUES ('delete', old.id, old.title, old.author, old.abstract);
+        INSERT INTO library_book_fts(rowid, title, author, abstract)
+        VALUES (new.id, new.title, new.author, new.abstract);
+    END
+    """,
+]
+
+SQLITE_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS library_book_fts_au",
+    "DROP TRIGGER IF EXISTS library_book_fts_ad",
+    "DROP TRIGGER IF EXISTS library_book_fts_ai",
+    "DROP TABLE IF EXISTS library_book_fts",
+]
+
+
+def install(connection):
+    """Create the search column/table, indexes and triggers. Safe to run repeatedly."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for sql in POSTGRES_INSTALL:
+                cursor.execute(sql)
+        elif connection.vendor == 'sqlite':
+            # SQLite drops triggers when a migration rebuilds library_book, so
+            # reinstall them and resync the index whenever they are missing
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'library_book_fts_ai'")
+            if cursor.fetchone() is None:
+                for sql in SQLITE_INSTALL:
+                    cursor.execute(sql)
+                cursor.execute("INSERT INTO library_book_fts(library_book_fts) VALUES ('rebuild')")
+
+
+def uninstall(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for sql in POSTGRES_UNINSTALL:
+                cursor.execute(sql)
+        elif connection.vendor == 'sqlite':
+            for sql in SQLITE_UNINSTALL:
+                cursor.execute(sql)
+
+
+def search(queryset, query):
+    """
+    Filter a Book queryset down to matches for `query` and annotate a `rank`
+    (higher is better).
+    """
+    vendor = connections[queryset.db].vendor
+
+    if vendor == 'postgresql':
+        # websearch_to_tsquery accepts free text ("quoted phrases", -excluded words)
+        # and never raises on user input; % is the pg_trgm similarity operator
+        tsquery = "websearch_to_tsquery('english', %s)"
+        return queryset.filter(
+            RawSQL(f"library_book.search_vector @@ {tsquery} OR library_book.author %% %s",
+                   (query, query), output_field=BooleanField())
+        ).annotate(
+            rank=RawSQL(f"greatest(ts_rank(library_book.search_vector, {tsquery}), similarity(library_book.author, %s))",
+                        (query, query), output_field=FloatField())
+        )
+
+    if vendor == 'sqlite':
+        # Quote every word so FTS5 operators in user input are matched literally,
+        # and allow prefix matches (e.g. "tolk" finds "Tolkien")
+        match = ' '.join('"{}"*'.format(word.replace('"', '""')) for word in query.split())
+        return queryset.filter(
+            RawSQL("library_book.id IN (SELECT rowid FROM library_book_fts WHERE library_book_fts MATCH %s)",
+                   (match,), output_field=BooleanField())
+        ).annotate(
+            rank=RawSQL("(SELECT -bm25(library_book_fts) FROM library_book_fts "
+                        "WHERE library_book_fts MATCH %s AND rowid = library_book.id)",
+                        (match,), output_field=FloatField())
+        )
+
+    # Other backends: unranked substring match
+    return queryset.filter(
+        Q(title__icontains=query) | Q(author__icontains=query) | Q(abstract__icontains=query)
+    ).annotate(rank=Value(0.0, output_field=FloatField()))
@@ -0,0 +1,449 @@
+"""
+In-process service layer for the book catalog and loans.
+
+Both the REST API (api/api.py) and the HTML views (library/views.py) call these
+functions directly, so rendering a page no longer costs a second HTTP request
+back into the same application.
+"""
+from collections import Counter
+from datetime import timedelta
+from itertools import chain
+from operator import itemgetter
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+
+from . import loan_state, roles, search, versions
+from .models import ArchivedLoan, Book, BookLoan, Hold
+
+
+class ServiceError(Exception):
+    """Raised when an operation can't be completed; the message is safe to show to users."""
+
+    def __init__(self, message="Unexpected error occurred."):
+        super().__init__(message)
+        self.message = message
+
+
+class ConflictError(ServiceError):
+    """Raised when a book changed since the caller read it."""
+
+    def __init__(self, message="This book was changed by someone else. Reload the page and try again."):
+        super().__init__(message)
+
+
+# ---------------------------------------------------------------------------
+# Book catalog
+# ---------------------------------------------------------------------------
+
+# Columns shown on a catalog card; the abstract is only needed on the detail page
+CARD_FIELDS = ('id', 'title', 'author', 'stock', 'version')
+
+BOOK_PAGE_SIZE = 24
+
+
+def list_books(fields=None):
+    """Return every book in the catalog, loading only the given fields if any."""
+    books = Book.objects.all()
+    if fields:
+        columns = {field.name for field in Book._meta.concrete_fields}
+        books = books.only('id', *(columns.intersection(fields)))
+    return books
+
+
+def book_page(after=None, size=BOOK_PAGE_SIZE):
+    """
+    Return a page of catalog cards with id greater than `after`, plus the
+    cursor for the next page (None on the last page).
+    """
+    books = list_books(CARD_FIELDS).order_by('id')
+    if after:
+        books = books.filter(id__gt=after)
+
+    books = list(books[:size + 1])
+    next_after = books[size - 1].id if len(books) > size else None
+    return books[:size], next_after
+
+
+SEARCH_LIMIT = 20
+
+
+def search_books(query, min_year=None, max_year=None, in_stock=False, fields=None, limit=SEARCH_LIMIT):
+    """
+    Return the best `limit` catalog matches for a free-text query, optionally
+    restricted to a publication year range and to books with copies available.
+    """
+    books = list_books(fields)
+    if min_year is not None:
+        books = books.filter(publication_year__gte=min_year)
+    if max_year is not None:
+        books = books.filter(publication_year__lte=max_year)
+    if in_stock:
+        books = books.filter(stock__gt=0)
+
+    return search.search(books, query).order_by('-rank', 'id')[:limit]
+
+
+def get_book(book_id):
+    """Return a single book or raise Http404."""
+    return get_object_or_404(Book, id=book_id)
+
+
+def create_book(**fields):
+    """Create a book from already validated fields."""
+    return Book.objects.create(**fields)
+
+
+def update_book(book, changes, expected_version=None):
+    """
+    Write only the changed fields (`changes` maps field name to validated value)
+    to a book, provided the row still has `expected_version` (by default the
+    version `book` was read with). Raises ConflictError if someone else wrote
+    the book in between. Returns `book` updated in place, so callers don't need
+    to read it again.
+    """
+    if expected_version is None:
+        expected_version = book.version
+    if not changes:
+        return book
+
+    with transaction.atomic():
+        updated = Book.objects.filter(id=book.id, version=expected_version).update(
+            version=F('version') + 1, **changes
+        )
+        if not updated:
+            get_book(book.id)  # Raise Http404 if the book was deleted
+            raise ConflictError()
+        versions.book_changed(book.id)
+
+    for name, value in changes.items():
+        setattr(book, name, value)
+    book.version = expected_version + 1
+    return book
+
+
+def delete_book(book_id):
+    """Delete a book or raise Http404 if it doesn't exist."""
+    get_book(book_id).delete()
+
+
+# ---------------------------------------------------------------------------
+# Loans
+# ---------------------------------------------------------------------------
+
+def current_loans(user):
+    """
+    Return the most recent loan for each book the user has interacted with.
+
+    The latest loans are tracked in CurrentLoan (see library.loan_state), so
+    this is one lookup on its (user, book) index instead of a pass over the
+    user's whole loan history.
+    """
+    # Book fields are annotated so templates can read them without touching loan.book
+    return BookLoan.objects.filter(current__user=user).order_by('book_id').select_related('book').annotate(
+        book_title=F('book__title'),
+        book_author=F('book__author'),
+    )
+
+
+HISTORY_PAGE_SIZE = 50
+HISTORY_FIELDS = ('id', 'book_id', 'book_title', 'book_author', 'loan_date', 'due_date', 'return_date')
+
+
+def loan_history(user, before=None, size=HISTORY_PAGE_SIZE):
+    """
+    Return a page of the user's loans, newest first, across live and archived
+    loans (see library.archive), plus the cursor for the next page (None on
+    the last page). Rows are dicts with HISTORY_FIELDS.
+    """
+    pages = []
+    for model in (BookLoan, ArchivedLoan):
+        loans = model.objects.filter(user=user)
+        if before:
+            loans = loans.filter(id__lt=before)
+        # Both sides are bounded: live loans by archival, archived ones by the (user, -id) index
+        pages.append(loans.annotate(book_title=F('book__title'), book_author=F('book__author'))
+                     .values(*HISTORY_FIELDS).order_by('-id')[:size + 1])
+
+    loans = sorted(chain(*pages), key=itemgetter('id'), reverse=True)
+    next_before = loans[size - 1]['id'] if len(loans) > size else None
+    return loans[:size], next_before
+
+
+def loan_period(loan_days, role):
+    """Loan length: the book's own `loan_days` if set, else settings.LOAN_DAYS for the borrower's role."""
+    policy = getattr(settings, 'LOAN_DAYS', {})
+    return timedelta(days=loan_days or policy.get(role, policy.get('regular', 14)))
+
+
+def borrow_book(user, book_id):
+    """
+    Create a new loan for a book.
+    Ensures:
+    - Book is in stock
+    - User doesn't already have an active loan for that book
+
+    The stock check and decrement are a single conditional UPDATE, and the
+    unique_open_loan constraint rejects a second open loan, so concurrent
+    borrows can neither oversell a book nor double-book it.
+    """
+    with transaction.atomic():
+        # UPDATE book SET stock = stock - 1 WHERE id = ... AND stock > 0
+        if not Book.objects.filter(id=book_id, stock__gt=0).update(stock=F('stock') - 1, version=F('version') + 1):
+            get_book(book_id)  # Raise Http404 for unknown books
+            raise ServiceError('This book is currently not available.')
+
+        today = timezone.now().date()
+        loan_days = Book.objects.filter(id=book_id).values_list('loan_days', flat=True).get()
+
+        # Prevent borrowing the same book more than once without returning
+        try:
+            with transaction.atomic():
+                loan = BookLoan.objects.create(
+                    user=user,
+                    book_id=book_id,
+                    loan_date=today,
+                    due_date=today + loan_period(loan_days, roles.role_for(user)),
+                )
+        except IntegrityError:
+            # Leaving the outer block with an exception rolls back the decrement
+            raise ServiceError("You already borrowed this book and haven't returned it.")
+
+        loan_state.record([loan])
+
+        # Stock is part of the cached catalog representation
+        versions.book_changed(book_id)
+
+    return loan
+
+
+def return_book(user, book_id):
+    """
+    Return a borrowed book.
+    - Marks the user's active loan for the book as returned
+    - Increments the book's stock
+    Both updates run in one transaction without reading the rows first. The
+    book row is updated (and so locked) first, matching the lock order of
+    borrow_book and the batch operations below.
+    """
+    with transaction.atomic():
+        # Increase book stock
+        Book.objects.filter(id=book_id).update(stock=F('stock') + 1, version=F('version') + 1)
+
+        returned = BookLoan.objects.filter(
+            user=user, book_id=book_id, return_date__isnull=True
+        ).update(return_date=timezone.now().date())
+
+        if not returned:
+            # Leaving the block with an exception rolls back the increment
+            raise ServiceError('You already returned this book or never borrowed it.')
+
+        # The returned copy goes straight to the first user waiting for it, if any
+        _fill_holds(book_id, 1)
+
+        versions.book_changed(book_id)
+        versions.loans_changed(user.id)
+
+
+# ---------------------------------------------------------------------------
+# Batch loans (circulation desk)
+# ---------------------------------------------------------------------------
+
+def _lock_books(book_ids):
+    # Lock every affected book in id order so concurrent batches can't deadlock
+    return {book.id: book for book in Book.objects.select_for_update().filter(id__in=book_ids).order_by('id')}
+
+
+def _open_loans(operations):
+    user_ids = {user_id for user_id, _ in operations}
+    book_ids = {book_id for _, book_id in operations}
+    loans = BookLoan.objects.filter(user_id__in=user_ids, book_id__in=book_ids, return_date__isnull=True)
+    return {(loan.user_id, loan.book_id): loan for loan in loans}
+
+
+def borrow_books(operations):
+    """
+    Create loans for a batch of (user_id, book_id) pairs.
+
+    Runs a fixed number of queries whatever the batch size: lock the books,
+    load existing users and open loans, insert the new loans, write the new
+    stock. Returns one result dict per operation, in order.
+    """
+    today = timezone.now().date()
+
+    with transaction.atomic():
+        books = _lock_books({book_id for _, book_id in operations})
+        user_roles = dict(User.objects.filter(id__in={user_id for user_id, _ in operations}).values_list('id', 'profile__role'))
+        open_loans = set(_open_loans(operations))
+
+        results = []
+        loans = []
+        for user_id, book_id in operations:
+            book = books.get(book_id)
+            result = {'user_id': user_id, 'book_id': book_id}
+            if book is None:
+                result['error'] = 'Book not found.'
+            elif user_id not in user_roles:
+                result['error'] = 'User not found.'
+            elif book.stock < 1:
+                result['error'] = 'This book is currently not available.'
+            elif (user_id, book_id) in open_loans:
+                result['error'] = "User already borrowed this book and hasn't returned it."
+            else:
+                book.stock -= 1
+                open_loans.add((user_id, book_id))
+                due_date = today + loan_period(book.loan_days, user_roles[user_id])
+                loans.append(BookLoan(user_id=user_id, book_id=book_id, loan_date=today, due_date=due_date))
+                result['status'] = 'created'
+            result.setdefault('status', 'error')
+            results.append(result)
+
+        BookLoan.objects.bulk_create(loans)
+        loan_state.record(loans)
+        _save_stock(books, {loan.book_id for loan in loans}, {loan.user_id for loan in loans})
+
+    # Loan ids are only known after the insert
+    created = iter(loans)
+    for result in results:
+        if result['status'] == 'created':
+            result['loan_id'] = next(created).id
+    return results
+
+
+def return_books(operations):
+    """
+    Return a batch of (user_id, book_id) loans with a fixed number of queries:
+    lock the books, load the open loans, close them, write the new stock.
+    Returns one result dict per operation, in order.
+    """
+    with transaction.atomic():
+        books = _lock_books({book_id for _, book_id in operations})
+        open_loans = _open_loans(operations)
+
+        results = []
+        returned = []
+        for user_id, book_id in operations:
+            loan = open_loans.pop((user_id, book_id), None)
+            result = {'user_id': user_id, 'book_id': book_id}
+            if loan is None:
+                result.update(status='error', error='User already returned this book or never borrowed it.')
+            else:
+                books[book_id].stock += 1
+                returned.append(loan)
+                result.update(status='returned', loan_id=loan.id)
+            results.append(result)
+
+        BookLoan.objects.filter(id__in=[loan.id for loan in returned]).update(return_date=timezone.now().date())
+        _save_stock(books, {loan.book_id for loan in returned}, {loan.user_id for loan in returned})
+
+        # Only books with a queue cost extra queries
+        copies = Counter(loan.book_id for loan in returned)
+        for book_id in Hold.objects.filter(book_id__in=copies).values_list('book_id', flat=True).distinct():
+            _fill_holds(book_id, copies[book_id])
+
+    return results
+
+
+def _save_stock(books, book_ids, user_ids):
+    # One UPDATE ... CASE for every changed book; safe because the rows are locked
+    changed = [books[book_id] for book_id in book_ids]
+    for book in changed:
+        book.version += 1
+    Book.objects.bulk_update(changed, ['stock', 'version'])
+    versions.books_changed(book_ids)
+    for user_id in user_ids:
+        versions.loans_changed(user_id)
+
+
+# ---------------------------------------------------------------------------
+# Holds (FIFO queue for out-of-stock books)
+# ---------------------------------------------------------------------------
+
+def hold_position(hold):
+    """1-based place of a hold in its book's queue, counted on the (book, id) index."""
+    return Hold.objects.filter(book_id=hold.book_id, id__lte=hold.id).count()
+
+
+def user_holds(user):
+    """The user's holds, oldest first, as dicts with book_id, book_title and position."""
+    ahead = Hold.objects.filter(book_id=OuterRef('book_id'), id__lte=OuterRef('id')).values('book_id')
+    return list(
+        Hold.objects.filter(user=user).order_by('id')
+        .annotate(book_title=F('book__title'), position=Subquery(ahead.annotate(n=Count('id')).values('n')))
+        .values('book_id', 'book_title', 'position')
+    )
+
+
+def place_hold(user, book_id):
+    """
+    Queue the user for an out-of-stock book. Returns (hold, position).
+
+    The book row is locked while checking its stock, so a concurrent return
+    either sees this hold and lends the copy to it, or commits first and the
+    user is told to borrow the book instead.
+    """
+    with transaction.atomic():
+        book = get_object_or_404(Book.objects.select_for_update().only('id', 'stock'), id=book_id)
+        if book.stock > 0:
+            raise ServiceError('This book is available; borrow it instead.')
+        if BookLoan.objects.filter(user=user, book_id=book_id, return_date__isnull=True).exists():
+            raise ServiceError("You already borrowed this book and haven't returned it.")
+
+        try:
+            with transaction.atomic():
+                hold = Hold.objects.create(user=user, book_id=book_id)
+        except IntegrityError:
+            raise ServiceError('You are already waiting for this book.')
+
+        return hold, hold_position(hold)
+
+
+def cancel_hold(user, book_id):
+    """Leave the queue for a book; everyone behind moves up one place."""
+    if not Hold.objects.filter(user=user, book_id=book_id).delete()[0]:
+        raise ServiceError('You are not waiting for this book.')
+
+
+def _fill_holds(book_id, copies):
+    """
+    Lend up to `copies` available copies of a book to the oldest holds, in the
+    caller's transaction. The caller has already locked the book row, so
+    concurrent returns of the same book serve the queue one at a time.
+    """
+    holds = Hold.objects.filter(book_id=book_id).select_related('user__profile').order_by('id')
+    today = timezone.now().date()
+    loan_days = None
+    lent = []
+
+    while len(lent) < copies:
+        hold = holds.first()
+        if hold is None:
+            break
+        if not Hold.objects.filter(id=hold.id).delete()[0]:
+            # Cancelled since it was read; the holder left the queue, so try the next
+            continue
+
+        if loan_days is None:
+            loan_days = Book.objects.filter(id=book_id).values_list('loan_days', flat=True).get() or 0
+        try:
+            with transaction.atomic():
+                lent.append(BookLoan.objects.create(
+                    user=hold.user,
+                    book_id=book_id,
+                    loan_date=today,
+                    due_date=today + loan_period(loan_days, roles.role_for(hold.user)),
+                ))
+        except IntegrityError:
+            # The holder got a copy some other way (e.g. the circulation desk); skip them
+            continue
+
+    if lent:
+        Book.objects.filter(id=book_id).update(stock=F('stock') - len(lent), version=F('version') + 1)
+        loan_state.record(lent)
+        versions.book_changed(book_id)
+        for loan in lent:
+            versions.loans_changed(loan.user_id)
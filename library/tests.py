@@ -1,3 +1,478 @@
-from django.test import TestCase
+import datetime
+import os
+import threading
+import time
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+
+from djangolibrary import settings as project_settings
+
+from . import archive, bulk, catalog_cache, loan_state, services, versions
+from .management.commands import remote_load_test
+from .models import ArchivedLoan, Book, BookLoan, Hold
+from .routers import ReplicaRouter, read_from_replica
+from .services import ServiceError
+
+
+def run_concurrently(target, args_list):
+    """
+    Call target(*args) for every args tuple at the same time, one thread each.
+    Returns one result per call, in no particular order: 'ok', 'refused' for a
+    ServiceError, or the repr of any other exception so it fails the test
+    instead of vanishing with its thread.
+    """
+    barrier = threading.Barrier(len(args_list))
+    results = []
+
+    def run(*args):
+        try:
+            barrier.wait()
+            target(*args)
+            results.append('ok')
+        except ServiceError:
+            results.append('refused')
+        except Exception as e:
+            results.append(repr(e))
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=run, args=args) for args in args_list]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+# Real threads and commits, so the conditional stock UPDATE and the
+# unique_open_loan constraint are what keep the numbers right. SQLite locks
+# the whole database instead of rows and fails concurrent writers with
+# "database table is locked", so these only run on PostgreSQL.
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentBorrowTests(TransactionTestCase):
+    def setUp(self):
+        self.book = Book.objects.create(title='Dune', author='Frank Herbert', publication_year=1965, stock=3)
+
+    def assertOnlyOutcomes(self, results, outcomes):
+        self.assertEqual(set(results) - set(outcomes), set(), 'unexpected errors in worker threads')
+
+    def test_concurrent_borrows_never_oversell(self):
+        users = [User.objects.create_user(f'reader{n}') for n in range(8)]
+
+        results = run_concurrently(services.borrow_book, [(user, self.book.id) for user in users])
+
+        self.assertOnlyOutcomes(results, {'ok', 'refused'})
+        self.book.refresh_from_db()
+        self.assertEqual(results.count('ok'), 3)
+        self.assertEqual(self.book.stock, 0)
+        self.assertEqual(BookLoan.objects.filter(book=self.book, return_date__isnull=True).count(), 3)
+
+    def test_concurrent_borrows_by_one_user_open_one_loan(self):
+        user = User.objects.create_user('reader')
+
+        results = run_concurrently(services.borrow_book, [(user, self.book.id)] * 4)
+
+        self.assertOnlyOutcomes(results, {'ok', 'refused'})
+        self.book.refresh_from_db()
+        self.assertEqual(results.count('ok'), 1)
+        self.assertEqual(self.book.stock, 2)
+        self.assertEqual(BookLoan.objects.filter(user=user, book=self.book, return_date__isnull=True).count(), 1)
+
+    def cycles_per_second(self, book, threads, cycles=25):
+        """Borrow and return the book `cycles` times in each of `threads` threads."""
+        users = [User.objects.create_user(f'cycler{threads}-{n}') for n in range(threads)]
+
+        def cycle(user):
+            for _ in range(cycles):
+                services.borrow_book(user, book.id)
+                services.return_book(user, book.id)
+
+        started = time.perf_counter()
+        results = run_concurrently(cycle, [(user,) for user in users])
+        elapsed = time.perf_counter() - started
+
+        self.assertOnlyOutcomes(results, {'ok'})
+        return threads * cycles / elapsed
+
+    def test_throughput_holds_up_on_a_hot_book(self):
+        # A copy per thread, so every borrow succeeds. Every cycle still
+        # serializes on the same Book row, so more threads can't go much
+        # faster; they must not collapse into lock waits or errors either
+        hot = Book.objects.create(title='Hot', author='Crowd', publication_year=2000, stock=8)
+        single = self.cycles_per_second(hot, threads=1)
+        contended = self.cycles_per_second(hot, threads=8)
+
+        hot.refresh_from_db()
+        self.assertEqual(hot.stock, 8)
+        self.assertFalse(BookLoan.objects.filter(book=hot, return_date__isnull=True).exists())
+        self.assertGreaterEqual(contended, single / 2)
+
+
+class BulkImportTests(TestCase):
+    def test_reimport_does_not_lose_a_concurrent_version_bump(self):
+        book = Book.objects.create(isbn='9780441013593', title='Dune', author='Frank Herbert', publication_year=1965, stock=1)
+        row = {'isbn': '9780441013593', 'title': 'Dune', 'author': 'Frank Herbert', 'publication_year': '1965', 'stock': '4'}
+        bulk_create = Book.objects.bulk_create
+
+        def bump_then_create(*args, **kwargs):
+            # Someone else saves the book after the import has looked it up
+            Book.objects.filter(id=book.id).update(version=F('version') + 1)
+            return bulk_create(*args, **kwargs)
+
+        with mock.patch.object(Book.objects, 'bulk_create', bump_then_create):
+            result = bulk.import_rows([row])
+
+        self.assertEqual((result.created, result.updated), (0, 1))
+        self.assertEqual(Book.objects.values_list('stock', 'version').get(id=book.id), (4, book.version + 2))
+
+
+class ArchiveTests(TestCase):
+    def test_old_loans_move_without_touching_loan_versions(self):
+        user = User.objects.create_user('reader')
+        book = Book.objects.create(title='Dune', author='Frank Herbert', publication_year=1965, stock=1)
+        returned = datetime.date(2020, 1, 1)
+        for day in range(1, 6):
+            BookLoan.objects.create(user=user, book=book, due_date=datetime.date(2019, 12, day), return_date=returned)
+        loan_state.rebuild()
+        version = versions.loans(user.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            moved = archive.archive_loans(datetime.date(2021, 1, 1), batch_size=2)
+
+        # The latest loan stays as the user's current loan for the book
+        self.assertEqual(moved, 4)
+        self.assertEqual(BookLoan.objects.filter(user=user).count(), 1)
+        self.assertEqual(list(ArchivedLoan.objects.order_by('id').values_list('due_date', flat=True)),
+                         [datetime.date(2019, 12, day) for day in range(1, 5)])
+        self.assertEqual(versions.loans(user.id), version)
+
+
+class QueryBudgetTests(TestCase):
+    def test_every_route_is_within_its_query_budget(self):
+        # Raises CommandError if a route has no budget, exceeds it or grows with the data
+        out = StringIO()
+        call_command('query_budget', small='20/200', large='200/2000', stdout=out)
+
+        self.assertIn('All routes are within their query budgets.', out.getvalue())
+
+
+class HoldQueueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title='Dune', author='Frank Herbert', publication_year=1965, stock=1)
+        cls.lender, cls.first, cls.second, cls.third = (
+            User.objects.create_user(name) for name in ('lender', 'first', 'second', 'third')
+        )
+
+    def setUp(self):
+        services.borrow_book(self.lender, self.book.id)
+
+    def queue(self):
+        for user in (self.first, self.second, self.third):
+            services.place_hold(user, self.book.id)
+
+    def open_loan(self, user):
+        return BookLoan.objects.filter(user=user, book=self.book, return_date__isnull=True).exists()
+
+    def test_holds_are_queued_in_arrival_order(self):
+        self.queue()
+
+        positions = [services.user_holds(user)[0]['position'] for user in (self.first, self.second, self.third)]
+        self.assertEqual(positions, [1, 2, 3])
+
+    def test_return_lends_the_copy_to_the_oldest_hold(self):
+        self.queue()
+
+        services.return_book(self.lender, self.book.id)
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.stock, 0)
+        self.assertTrue(self.open_loan(self.first))
+        self.assertFalse(self.open_loan(self.second))
+        self.assertEqual(list(Hold.objects.order_by('id').values_list('user', flat=True)), [self.second.id, self.third.id])
+        self.assertEqual(services.user_holds(self.second)[0]['position'], 1)
+
+    def test_cancelled_holds_are_skipped(self):
+        self.queue()
+        services.cancel_hold(self.first, self.book.id)
+
+        services.return_book(self.lender, self.book.id)
+
+        self.assertFalse(self.open_loan(self.first))
+        self.assertTrue(self.open_loan(self.second))
+
+    def test_batch_return_serves_the_queue_in_order(self):
+        # A second copy, lent to `first`
+        Book.objects.filter(id=self.book.id).update(stock=1)
+        services.borrow_book(self.first, self.book.id)
+        services.place_hold(self.second, self.book.id)
+        services.place_hold(self.third, self.book.id)
+
+        services.return_books([(self.lender.id, self.book.id), (self.first.id, self.book.id)])
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.stock, 0)
+        self.assertTrue(self.open_loan(self.second))
+        self.assertTrue(self.open_loan(self.third))
+        self.assertFalse(Hold.objects.exists())
+
+    def test_available_books_cannot_be_held(self):
+        services.return_book(self.lender, self.book.id)
+
+        with self.assertRaises(ServiceError):
+            services.place_hold(self.first, self.book.id)
+
+
+def queue_holders(book, count, prefix):
+    """Queue `count` new users for the book in arrival order and return them."""
+    users = User.objects.bulk_create([User(username=f'{prefix}{n}') for n in range(count)])
+    Hold.objects.bulk_create([Hold(user=user, book=book) for user in users])
+    return users
+
+
+class LongHoldQueueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title='Dune', author='Frank Herbert', publication_year=1965, stock=1)
+        cls.lender = User.objects.create_user('lender')
+        services.borrow_book(cls.lender, cls.book.id)
+        cls.holders = queue_holders(cls.book, 2000, 'holder')
+
+    def return_counting_queries(self, user):
+        with CaptureQueriesContext(connection) as queries:
+            services.return_book(user, self.book.id)
+        return len(queries)
+
+    def test_returns_serve_a_long_queue_in_order_at_constant_cost(self):
+        # Each holder returns the copy as soon as they get it
+        current, queries = self.lender, []
+        for holder in self.holders[:50]:
+            queries.append(self.return_counting_queries(current))
+            current = holder
+
+        lent = BookLoan.objects.filter(book=self.book).exclude(user=self.lender).order_by('id')
+        self.assertEqual(list(lent.values_list('user', flat=True)), [holder.id for holder in self.holders[:50]])
+
+        # With one hold left, a return costs what it did in front of 2000
+        Hold.objects.exclude(user=self.holders[-1]).delete()
+        queries.append(self.return_counting_queries(current))
+        self.assertEqual(set(queries), {queries[0]})
+        self.assertTrue(BookLoan.objects.filter(user=self.holders[-1], return_date__isnull=True).exists())
+        self.assertFalse(Hold.objects.exists())
+
+
+# Returns racing cancellations at the head of a long queue. Needs row locks,
+# like ConcurrentBorrowTests above.
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentHoldQueueTests(TransactionTestCase):
+    def setUp(self):
+        self.book = Book.objects.create(title='Dune', author='Frank Herbert', publication_year=1965, stock=20)
+        self.lenders = User.objects.bulk_create([User(username=f'lender{n}') for n in range(20)])
+        for lender in self.lenders:
+            services.borrow_book(lender, self.book.id)
+        self.holders = queue_holders(self.book, 3000, 'holder')
+
+    def test_returns_and_cancellations_keep_queue_order(self):
+        cancelled, latencies = set(), []
+
+        def cancel(user):
+            services.cancel_hold(user, self.book.id)
+            cancelled.add(user.id)
+
+        def give_back(user):
+            started = time.perf_counter()
+            services.return_book(user, self.book.id)
+            latencies.append(time.perf_counter() - started)
+
+        # The first 20 holders try to leave while the 20 copies come back
+        calls = [(cancel, holder) for holder in self.holders[:20]] + [(give_back, lender) for lender in self.lenders]
+        results = run_concurrently(lambda action, user: action(user), calls)
+
+        self.assertEqual(set(results) - {'ok', 'refused'}, set(), 'unexpected errors in worker threads')
+        self.assertEqual(results.count('ok'), 20 + len(cancelled))
+        lent = set(BookLoan.objects.filter(book=self.book, return_date__isnull=True).values_list('user', flat=True))
+        # Nobody who left the queue got a copy, and the copies went to the oldest remaining holds
+        remaining = [holder.id for holder in self.holders if holder.id not in cancelled]
+        self.assertEqual(lent & cancelled, set())
+        self.assertEqual(lent, set(remaining[:20]))
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.stock, 0)
+        self.assertEqual(Hold.objects.count(), 3000 - len(cancelled) - 20)
+        self.assertLess(max(latencies), 1)
+
+
+class DatabaseSettingsTests(SimpleTestCase):
+    def database(self, async_views=False, **env):
+        # Only the DB_* variables given here, whatever the environment running the tests sets
+        environ = {name: value for name, value in os.environ.items() if not name.startswith('DB_')}
+        with mock.patch.dict(os.environ, {**environ, **env}, clear=True), \
+                mock.patch.object(project_settings, '_ASYNC_VIEWS', async_views):
+            return project_settings._database('db.internal')
+
+    def test_postgres_defaults(self):
+        config = self.database()
+
+        self.assertEqual(config['HOST'], 'db.internal')
+        self.assertEqual(config['CONN_MAX_AGE'], 60)
+        self.assertEqual(config['OPTIONS'], {})
+
+    def test_asgi_closes_connections_after_each_request(self):
+        self.assertEqual(self.database(async_views=True)['CONN_MAX_AGE'], 0)
+        self.assertEqual(self.database(async_views=True, DB_CONN_MAX_AGE='30')['CONN_MAX_AGE'], 30)
+
+    def test_pool_replaces_persistent_connections(self):
+        config = self.database(DB_POOL_MAX_SIZE='8', DB_CONN_MAX_AGE='60', DB_STATEMENT_TIMEOUT='5000')
+
+        self.assertEqual(config['CONN_MAX_AGE'], 0)
+        self.assertEqual(config['OPTIONS']['pool'], {'min_size': 2, 'max_size': 8, 'timeout': 10})
+        self.assertEqual(config['OPTIONS']['options'], '-c statement_timeout=5000')
+
+    def test_postgres_options_are_skipped_on_other_engines(self):
+        config = self.database(DB_ENGINE='django.db.backends.sqlite3', DB_POOL_MAX_SIZE='8', DB_STATEMENT_TIMEOUT='5000')
+
+        self.assertEqual(config['OPTIONS'], {})
+        self.assertEqual(config['CONN_MAX_AGE'], 60)
+
+
+# A stand-in PostgreSQL replica: the router only looks at the alias, so
+# nothing ever connects to it
+REPLICA = {'ENGINE': 'django.db.backends.postgresql', 'NAME': 'library', 'HOST': 'localhost'}
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    def read_db(self):
+        return self.router.db_for_read(Book)
+
+    def test_reads_stay_on_primary_without_a_replica(self):
+        with read_from_replica(0):
+            self.assertEqual(self.read_db(), 'default')
+
+    @mock.patch.dict(settings.DATABASES, {'replica': REPLICA})
+    def test_opted_in_reads_of_settled_data_use_the_replica(self):
+        with read_from_replica(0):
+            self.assertEqual(self.read_db(), 'replica')
+        self.assertEqual(self.read_db(), 'default')
+
+    @mock.patch.dict(settings.DATABASES, {'replica': REPLICA})
+    def test_recently_changed_data_is_read_from_the_primary(self):
+        with read_from_replica(time.time_ns()):
+            self.assertEqual(self.read_db(), 'default')
+
+    @mock.patch.dict(settings.DATABASES, {'replica': REPLICA})
+    def test_transactions_read_their_own_writes(self):
+        with read_from_replica(0), mock.patch.object(connections['default'], 'in_atomic_block', True):
+            self.assertEqual(self.read_db(), 'default')
+
+    @mock.patch.dict(settings.DATABASES, {'replica': REPLICA})
+    def test_writes_and_migrations_use_the_primary(self):
+        with read_from_replica(0):
+            self.assertEqual(self.router.db_for_write(Book), 'default')
+        self.assertTrue(self.router.allow_migrate('default', 'library'))
+        self.assertFalse(self.router.allow_migrate('replica', 'library'))
+
+
+class RemoteLoadTests(SimpleTestCase):
+    def test_async_worker_outserves_a_sync_worker(self):
+        # A stub API answering in 20 ms caps a sync worker near 50 requests/sec
+        results = remote_load_test.Command().run(seconds=0.5, latency=20, concurrency=10)
+
+        self.assertEqual([result['errors'] for result in results.values()], [0, 0, 0])
+        self.assertLess(results['sync, pooled session']['rate'], 55)
+        self.assertGreater(results['async, shared client']['rate'], 2 * results['sync, pooled session']['rate'])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                       'LOCATION': 'catalog-cache-tests'}})
+class CatalogCacheCoalescingTests(SimpleTestCase):
+    def setUp(self):
+        catalog_cache._cache().clear()
+        self.calls = 0
+        self.calls_lock = threading.Lock()
+
+    def slow_compute(self, fail=False):
+        def compute():
+            with self.calls_lock:
+                self.calls += 1
+                first = self.calls == 1
+            time.sleep(0.2)
+            if fail and first:
+                raise RuntimeError('database went away')
+            return {'results': []}
+        return compute
+
+    def crowd(self, compute, size=20):
+        """`size` threads miss the same page at once; returns their results."""
+        barrier = threading.Barrier(size)
+        results = []
+
+        def read():
+            barrier.wait()
+            try:
+                results.append(catalog_cache.get_list('/api/books/', compute))
+            except RuntimeError as e:
+                results.append(e)
+
+        threads = [threading.Thread(target=read) for _ in range(size)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_misses_compute_once(self):
+        results = self.crowd(self.slow_compute())
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [{'results': []}] * 20)
+
+    def test_followers_compute_themselves_when_the_leader_fails(self):
+        results = self.crowd(self.slow_compute(fail=True))
+
+        # Only the leader sees its error, and one follower computes for the rest
+        self.assertEqual(sum(isinstance(result, RuntimeError) for result in results), 1)
+        self.assertEqual(results.count({'results': []}), 19)
+        self.assertEqual(self.calls, 2)
+        self.calls = 0
+        self.assertEqual(catalog_cache.get_list('/api/books/', self.slow_compute()), {'results': []})
+        self.assertEqual(self.calls, 0)
+
+    def page_key(self):
+        return f'catalog:list:{versions.catalog()}:{catalog_cache._digest("/api/books/")}'
+
+    def test_waits_for_another_process_holding_the_lock(self):
+        key = self.page_key()
+        catalog_cache._cache().add(f'{key}:lock', 1)
+        threading.Timer(0.2, catalog_cache._cache().set, (key, {'results': ['from elsewhere']})).start()
+
+        self.assertEqual(catalog_cache.get_list('/api/books/', self.slow_compute()), {'results': ['from elsewhere']})
+        self.assertEqual(self.calls, 0)
+
+    @mock.patch.object(catalog_cache, 'COALESCE_TIMEOUT', 0.3)
+    def test_computes_after_another_process_holds_the_lock_too_long(self):
+        catalog_cache._cache().add(f'{self.page_key()}:lock', 1)
+
+        self.assertEqual(catalog_cache.get_list('/api/books/', self.slow_compute()), {'results': []})
+        self.assertEqual(self.calls, 1)
+
+
+# Real concurrent writes again, so like ConcurrentBorrowTests this needs row locks
+@skipUnlessDBFeature('has_select_for_update')
+class FlashCrowdTests(TransactionTestCase):
+    def test_flash_crowd_is_throttled_without_overselling(self):
+        out = StringIO()
+        # More readers than the per-book limit allows; raises CommandError on any problem
+        call_command('flash_crowd', users=500, stock=5, threads=25, stdout=out)
+
+        self.assertIn('429: ', out.getvalue())
+        self.assertIn('The crowd was served without overselling.', out.getvalue())
@@ -0,0 +1,98 @@
+"""
+Version counters for cached and conditional (ETag/Last-Modified) responses.
+
+Each counter lives in the cache and holds the time.time_ns() of the last change,
+so it works both as a cache key component and as a Last-Modified timestamp
+without touching the database. There is one counter for the whole catalog, one
+per book and one per user's loans. The counters are only consistent if all
+workers share CATALOG_CACHE_ALIAS; library/checks.py refuses a per-process
+cache when WEB_CONCURRENCY runs several workers.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+CATALOG_KEY = 'catalog:version'
+
+
+def _cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def _book_key(book_id):
+    return f'catalog:book-version:{book_id}'
+
+
+def _loans_key(user_id):
+    return f'loans:version:{user_id}'
+
+
+def _get(key):
+    version = _cache().get(key)
+    if version is None:
+        # A missing counter (first use or evicted) starts at "now", so it can
+        # never match keys or ETags derived from an older value
+        _cache().add(key, time.time_ns(), None)
+        version = _cache().get(key)
+    return version
+
+
+def _bump(key):
+    # Never move backwards, even if two hosts' clocks disagree
+    _cache().set(key, max(time.time_ns(), (_cache().get(key) or 0) + 1), None)
+
+
+def catalog():
+    return _get(CATALOG_KEY)
+
+
+def book(book_id):
+    return _get(_book_key(book_id))
+
+
+def loans(user_id):
+    return _get(_loans_key(user_id))
+
+
+def book_changed(book_id):
+    """Bump the book's and the catalog's versions once the current transaction commits."""
+    def bump():
+        _bump(_book_key(book_id))
+        _bump(CATALOG_KEY)
+
+    transaction.on_commit(bump)
+
+
+def books_changed(book_ids):
+    """book_changed() for many books at once, for bulk writes that don't send signals."""
+    def bump():
+        now = time.time_ns()
+        _cache().set_many({_book_key(book_id): now for book_id in book_ids}, None)
+        _bump(CATALOG_KEY)
+
+    transaction.on_commit(bump)
+
+
+def loans_changed(user_id):
+    """Bump the user's loan version once the current transaction commits."""
+    transaction.on_commit(lambda: _bump(_loans_key(user_id)))
+
+
+# Signal receivers, connected in LibraryConfig.ready()
+
+def book_saved(sender, instance, **kwargs):
+    book_changed(instance.pk)
+
+
+def book_deleted(sender, instance, **kwargs):
+    book_changed(instance.pk)
+
+
+def loan_saved(sender, instance, **kwargs):
+    loans_changed(instance.user_id)
+
+
+def loan_deleted(sender, instance, **kwargs):
+    loans_changed(instance.user_id)
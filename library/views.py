@@ -4,239 +4,135 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.models import User
 from django.contrib.auth import login, logout, authenticate
+from django.core.exceptions import PermissionDenied
+from django.http import Http404
 from django.shortcuts import render, redirect
-from django.utils import timezone
 from django.views.decorators.http import require_POST
 from django.db import IntegrityError
 
-# Import custom forms, models, and configuration
+# Import custom forms, models, and the data backend (in-process services or remote API)
 from .forms import BookForm
-from .models import Book, Profile
-from .config import API_BASE_URL
-import requests  # Used to make HTTP requests to external/internal APIs
+from .models import Profile
+from .backends import get_backend
+from .roles import admin_required, is_admin
+from .services import ServiceError
 
-# View for displaying the homepage with a list of books from an external API
+# View for displaying the homepage with one page of the book catalog
 @login_required
 def home(request):
-    url = f'{API_BASE_URL}/api/books/'
-    cookies = {
-        'sessionid': request.COOKIES.get('sessionid')  # Pass session cookie for authentication
-    }
-    response = requests.get(url, cookies=cookies)
-    data = []
-    if response.status_code == 200:
-        data = response.json()
-    else:
-        data = []
-
+    books, next_cursor = get_backend(request).list_books(request.GET.get('cursor'))
     return render(request, 'home.html', {
-        'books': data  # Render the list of books in the template
+        'books': books,  # Render the current page of books in the template
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
     })
 
-# View to list current book loans from the API
+# View to list current book loans
 @login_required
 def books(request):
-    cookies = {
-        'sessionid': request.COOKIES.get('sessionid')
-    }
-    url = f'{API_BASE_URL}/api/loans/'
-    response = requests.get(url, cookies=cookies)
-
-    loans = response.json() if response.status_code == 200 else []
     return render(request, 'books.html', {
-        'loans': loans
+        'loans': get_backend(request).list_loans()
     })
 
-# View to borrow a book by sending a POST request to the API
+# View to borrow a book
 @login_required
 def borrow_book(request, book_id):
-    url = f'{API_BASE_URL}/api/loans/create-loan/'
-    csrf_token = request.COOKIES.get('csrftoken')
-    headers = {
-        'Content-Type': 'application/json',
-        'X-CSRFToken': csrf_token,
-        'Referer': API_BASE_URL
-    }
-
-    cookies = {
-        'sessionid': request.COOKIES.get('sessionid'),
-        'csrftoken': csrf_token
-    }
-
-    payload = {
-        'book_id': book_id
-    }
-
-    response = requests.post(url, json=payload, cookies=cookies, headers=headers)
-
-    if response.status_code == 201:
-        messages.success(request, "Loan created successfully.")
-        return redirect('books')
-
-    # Handle possible errors
     try:
-        loans = response.json()
-    except ValueError:
-        messages.warning(request, "Unexpected error occurred.")
-        return redirect('books')
-
-    if isinstance(loans, dict) and 'error' in loans:
-        messages.warning(request, loans['error'])
+        get_backend(request).borrow_book(book_id)
+    except Http404:
+        messages.warning(request, "Book not found.")
+    except ServiceError as e:
+        messages.warning(request, e.message)
+    else:
+        messages.success(request, "Loan created successfully.")
 
     return redirect('books')
 
-# View to return a borrowed book by sending a POST request to the API
+# View to return a borrowed book
 @login_required
 def return_book(request, book_id):
-    url = f'{API_BASE_URL}/api/loans/return-loan/'
-    csrf_token = request.COOKIES.get('csrftoken')
-    headers = {
-        'Content-Type': 'application/json',
-        'X-CSRFToken': csrf_token,
-        'Referer': API_BASE_URL
-    }
-
-    cookies = {
-        'sessionid': request.COOKIES.get('sessionid'),
-        'csrftoken': csrf_token
-    }
-
-    payload = {
-        'book_id': book_id
-    }
-
-    response = requests.post(url, json=payload, cookies=cookies, headers=headers)
-
-    if response.status_code == 200:
-        messages.success(request, "Book returned successfully.")
-        return redirect('books')
-
     try:
-        loans = response.json()
-    except ValueError:
-        messages.warning(request, "Unexpected error occurred.")
-        return redirect('books')
-
-    if isinstance(loans, dict) and 'error' in loans:
-        messages.warning(request, loans['error'])
+        get_backend(request).return_book(book_id)
+    except ServiceError as e:
+        messages.warning(request, e.message)
+    else:
+        messages.success(request, "Book returned successfully.")
 
     return redirect('books')
 
-# View to create a new book by submitting a form to the API
+# View to create a new book (admins only)
 @login_required
+@admin_required
 def create_book(request):
     if request.method == 'GET':
         return render(request, 'create_book.html', {
             'form': BookForm
         })
     else:
-        url = f'{API_BASE_URL}/api/books/'
-        csrf_token = request.COOKIES.get('csrftoken')
-        headers = {
-            'Content-Type': 'application/json',
-            'X-CSRFToken': csrf_token,
-            'Referer': API_BASE_URL
-        }
-
-        cookies = {
-            'sessionid': request.COOKIES.get('sessionid'),
-            'csrftoken': csrf_token
-        }
-
-        payload = request.POST.dict()
-        response = requests.post(url, json=payload, cookies=cookies, headers=headers)
-
-        if response.status_code == 201:
-            messages.success(request, "Book created successfully.")
-            return redirect('home')
-
-        try:
-            response = response.json()
-        except ValueError:
-            messages.warning(request, "Unexpected error occurred.")
-
-        if isinstance(response, dict) and 'error' in response:
-            messages.warning(request, response['error'])
+        form = BookForm(request.POST)
+        if form.is_valid():
+            try:
+                get_backend(request).create_book(form.cleaned_data)
+            except ServiceError as e:
+                messages.warning(request, e.message)
+            else:
+                messages.success(request, "Book created successfully.")
+                return redirect('home')
 
         return render(request, 'create_book.html', {
-            'form': BookForm,
+            'form': form,
         })
 
-# View to delete a book by making a DELETE request to the API
+# View to delete a book (admins only)
 @login_required
+@admin_required
+@require_POST
 def delete_book(request, book_id):
-    url = f'{API_BASE_URL}/api/books/{book_id}/'
-    csrf_token = request.COOKIES.get('csrftoken')
-
-    headers = {
-        'X-CSRFToken': csrf_token,
-        'Content-Type': 'application/json',
-        'Referer': API_BASE_URL
-    }
-
-    cookies = {
-        'sessionid': request.COOKIES.get('sessionid'),
-        'csrftoken': csrf_token
-    }
-
     try:
-        response = requests.delete(url, headers=headers, cookies=cookies)
-
-        if response.status_code == 204:
-            messages.success(request, "Book deleted successfully.")
-        elif response.status_code == 404:
-            messages.error(request, "Book not found.")
-        else:
-            messages.error(request, f"Unexpected response: {response.status_code} - {response.text}")
-
-    except requests.RequestException as e:
-        messages.error(request, f"Request failed: {str(e)}")
+        get_backend(request).delete_book(book_id)
+    except Http404:
+        messages.error(request, "Book not found.")
+    except ServiceError as e:
+        messages.error(request, e.message)
+    else:
+        messages.success(request, "Book deleted successfully.")
 
     return redirect('home')
 
-# View to view and update details of a specific book
+# View to view details of a specific book; only admins may update it
 @login_required
 def detail_book(request, book_id):
-    url = f'{API_BASE_URL}/api/books/{book_id}'
-    cookies = {
-        'sessionid': request.COOKIES.get('sessionid')
-    }
-    response = requests.get(url, cookies=cookies)
-
-    if response.status_code == 200:
-        data = response.json()
-        book = Book(**data)
-        form = BookForm(instance=book)
+    if request.method == 'POST' and not is_admin(request.user):
+        raise PermissionDenied
 
-        if request.method == 'GET':
-            return render(request, 'detail_book.html', {'book': book, 'form': form})
+    backend = get_backend(request)
+    book = backend.get_book(book_id)
 
-        # PATCH request to update the book
-        url = f'{API_BASE_URL}/api/books/{book_id}/'
-        csrf_token = request.COOKIES.get('csrftoken')
-
-        headers = {
-            'Content-Type': 'application/json',
-            'X-CSRFToken': csrf_token,
-            'Referer': API_BASE_URL
-        }
-
-        cookies = {
-            'sessionid': request.COOKIES.get('sessionid'),
-            'csrftoken': csrf_token,
-        }
+    if request.method == 'GET':
+        return render(request, 'detail_book.html', {'book': book, 'form': BookForm(instance=book)})
 
-        payload = request.POST.dict()
-        response = requests.patch(url, json=payload, headers=headers, cookies=cookies)
+    # The version the admin was editing; a newer one in the database means a conflicting edit
+    try:
+        expected_version = int(request.POST['version'])
+    except (KeyError, ValueError):
+        expected_version = book.version
 
-        if response.status_code == 200:
-            updated_data = response.json()
-            form = BookForm(initial=updated_data)
-            messages.success(request, "Book updated successfully.")
+    form = BookForm(request.POST, instance=book)
+    version = expected_version  # Keep the edit pinned to the old version until it succeeds
+    if form.is_valid():
+        try:
+            # Only the fields the admin actually changed are written
+            book = backend.update_book(book, {name: form.cleaned_data[name] for name in form.changed_data}, expected_version)
+        except ServiceError as e:
+            messages.error(request, "Error updating book: " + e.message)
         else:
-            messages.error(request, "Error updating book:" + response.content)
+            form = BookForm(instance=book)
+            version = book.version
+            messages.success(request, "Book updated successfully.")
+    else:
+        messages.error(request, "Error updating book: please check the form.")
 
-        return render(request, 'detail_book.html', {'book': book, 'form': form})
+    return render(request, 'detail_book.html', {'book': book, 'form': form, 'version': version})
 
 # View to handle user signup using Django's built-in form
 def signup(request):